@@ -3,6 +3,8 @@ import sys
 from pathlib import Path
 import re
 
+from palette import TILE_NAMES
+
 tile_count = {}
 total_count = 0
 
@@ -11,21 +13,9 @@ files = sys.argv[1:]
 
 
 def get_tile_name_alias(tile_number: str) -> str:
-    tile_name_alias = {
-        '1': '01 - White',
-        '2': '02 - Navy',
-        '3': '03 - Cyan',
-        '4': '04 - Teal',
-        '5': '05 - Green',
-        '6': '06 - Olive',
-        '7': '07 - Beige',
-        '8': '08 - Yellow',
-        '9': '09 - Orange',
-        '10': '10 - Coral',
-    }
-    if tile_name in tile_name_alias:
-        return tile_name_alias[tile_number]
-    return tile_name
+    if tile_number.isdigit() and 0 < int(tile_number) < len(TILE_NAMES):
+        return TILE_NAMES[int(tile_number)]
+    return tile_number
 
 
 def strip_ascii_grid_header(ascii_grid_contents: str) -> str:
@@ -4,9 +4,10 @@
 from pathlib import Path
 
 import click
-from PIL import Image
+from numpy import zeros, uint8
 
 from brightness_tile_proportions import BrightnessTileProportions
+from palette import parse_tile, save_palette_image
 
 
 @click.command()
@@ -28,18 +29,16 @@ def visualize(proportions, dst):
     brightness_range = 256
     max_height = 256
 
-    img = Image.new('RGB', (brightness_range, max_height), color=0)
+    img = zeros((max_height, brightness_range), dtype=uint8)
     for brightness in [i for i in sorted(brightness_count.keys())]:
         y_offset = 0
-        for tile in [i for i in sorted(brightness_count[brightness].keys())]:
-            rgb = tuple([int(b) for b in tile.split(',')])
+        tiles = sorted(brightness_count[brightness].keys(), key=parse_tile)
+        for tile in tiles:
             amount = int(brightness_count[brightness][tile] * 256)
-            for y in range(y_offset, y_offset + amount):
-                if y < img.height:
-                    img.putpixel((brightness, y), rgb)
+            img[y_offset:y_offset + amount, brightness] = parse_tile(tile)
             y_offset += amount
 
-    img.save(Path(dst).as_posix())
+    save_palette_image(img, Path(dst))
 
 
 if __name__ == '__main__':
@@ -0,0 +1,51 @@
+import json
+import os
+import shutil
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from numpy import ndarray, array, load, savez, int64
+
+
+class BandCheckpoints:
+    """
+    Stores each band of an image on disk once it has been rendered, alongside
+    the state needed to render the band after it, so that an interrupted
+    render can resume from the last band it finished. The checkpoints are
+    discarded if the image is rendered with different options.
+    """
+
+    def __init__(self, checkpoint_dir: Path, options: dict):
+        self.checkpoint_dir = checkpoint_dir
+        self.checkpoint_dir.mkdir(parents=True, exist_ok=True)
+
+        options_path = self.checkpoint_dir.joinpath('options.json')
+        if options_path.exists():
+            with open(options_path.as_posix()) as file:
+                if json.load(file) != options:
+                    for path in self.checkpoint_dir.glob('band_*.npz'):
+                        path.unlink()
+        with open(options_path.as_posix(), 'w') as file:
+            json.dump(options, file)
+
+    def get_path(self, index: int) -> Path:
+        return self.checkpoint_dir.joinpath('band_%d.npz' % index)
+
+    def get(self, index: int) -> Optional[Tuple[ndarray, List[int]]]:
+        try:
+            with load(self.get_path(index).as_posix()) as checkpoint:
+                return checkpoint['band'], checkpoint['state'].tolist()
+        except FileNotFoundError:
+            return None
+
+    def put(self, index: int, band: ndarray, state: List[int]):
+        # Write to a temporary file first, so that an interrupted render
+        # never leaves a partially written band behind.
+        path = self.get_path(index)
+        temporary_path = self.checkpoint_dir.joinpath('band_%d.tmp' % index)
+        with open(temporary_path.as_posix(), 'wb') as file:
+            savez(file, band=band, state=array(state, dtype=int64))
+        os.replace(temporary_path.as_posix(), path.as_posix())
+
+    def clear(self):
+        shutil.rmtree(self.checkpoint_dir.as_posix())
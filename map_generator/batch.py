@@ -0,0 +1,190 @@
+import json
+import os
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import List, Optional
+
+import click
+
+from pipeline import RegionConfig, complete_region_config, \
+    read_region_config, run_pipeline
+from step_cache import StepCache
+
+
+def read_manifest(manifest_path: Path) -> List[RegionConfig]:
+    """
+    Reads the regions listed in a manifest, which is a JSON list where each
+    region is either the path to its config, or the config itself, in which
+    case it must be named.
+    """
+    with open(manifest_path.as_posix()) as file:
+        entries = json.load(file)
+
+    regions = []
+    for entry in entries:
+        if isinstance(entry, str):
+            regions.append(read_region_config(Path(entry)))
+        elif 'name' in entry:
+            regions.append(complete_region_config(entry, entry['name']))
+        else:
+            raise Exception(
+                'Expected every region in %s to be named' % manifest_path
+            )
+
+    names = [region['name'] for region in regions]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if len(duplicates) > 0:
+        raise Exception(
+            'Found more than one region named %s' % ', '.join(duplicates)
+        )
+    return regions
+
+
+def get_region_seed(region: RegionConfig, seed: int) -> List[int]:
+    """
+    Returns the seed of a region, which unless the region has its own seed is
+    derived from the batch's seed and the region's name. This way a region
+    is rendered the same no matter which regions it is batched with, or the
+    order they finish in.
+    """
+    if region['seed'] is not None:
+        return [region['seed']]
+    return [seed, zlib.crc32(region['name'].encode('utf-8'))]
+
+
+def render_region(
+        region: RegionConfig,
+        output_dir: Path,
+        seed: List[int],
+        intermediates: bool,
+        lego: bool,
+        cache: Optional[StepCache]
+) -> float:
+    """
+    Renders a region in a worker process, and returns how many seconds it
+    took. The bathymetry data and shapefiles are kept open by each worker
+    between regions.
+    """
+    start = time.perf_counter()
+    run_pipeline(region, output_dir, intermediates, lego, seed, cache)
+    return time.perf_counter() - start
+
+
+@click.command()
+@click.argument(
+    'manifest',
+    nargs=1,
+    type=click.Path(exists=True)
+)
+@click.argument(
+    'output_dir',
+    nargs=1,
+    type=click.Path(file_okay=False)
+)
+@click.option(
+    "--workers",
+    default=None,
+    type=click.IntRange(min=1),
+    help='The number of regions to render at once. Defaults to the number '
+         'of CPUs.'
+)
+@click.option(
+    "--seed",
+    default=0,
+    type=click.INT,
+    help='The seed that the seed of every region without its own seed is '
+         'derived from.'
+)
+@click.option(
+    "--intermediates/--no-intermediates",
+    default=False,
+    help='Also saves the images of steps 1 to 4, for debugging.'
+)
+@click.option(
+    "--lego/--no-lego",
+    default=False,
+    help='Also runs step 6, rendering the tiles as LEGO.'
+)
+@click.option(
+    "--cache-dir",
+    default=None,
+    type=click.Path(file_okay=False),
+    help='A directory to cache the output of each step in, so that steps '
+         'whose options and inputs have not changed are skipped.'
+)
+@click.option(
+    "--cache-size",
+    default=1024,
+    type=click.IntRange(min=0),
+    help='The most megabytes to keep in the cache.'
+)
+def render(
+        manifest: str,
+        output_dir: str,
+        workers: Optional[int],
+        seed: int,
+        intermediates: bool,
+        lego: bool,
+        cache_dir: Optional[str],
+        cache_size: int
+):
+    """
+    Renders every region listed in the JSON MANIFEST in parallel, saving the
+    images to OUTPUT_DIR as <name>_step_<step>.png.
+    """
+    regions = read_manifest(Path(manifest))
+    output_path = Path(output_dir)
+    output_path.mkdir(parents=True, exist_ok=True)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    cache = None
+    if cache_dir is not None:
+        cache = StepCache(Path(cache_dir), cache_size * 1024 * 1024)
+
+    start = time.perf_counter()
+    durations = {}
+    failures = {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(
+                render_region,
+                region,
+                output_path,
+                get_region_seed(region, seed),
+                intermediates,
+                lego,
+                cache
+            ): region['name']
+            for region in regions
+        }
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                durations[name] = future.result()
+                print('Rendered %s in %.1fs' % (name, durations[name]))
+            except Exception as e:
+                failures[name] = e
+                print('Failed to render %s: %s' % (name, e))
+    wall_time = time.perf_counter() - start
+
+    # Print the summary in the order of the manifest.
+    print()
+    for region in regions:
+        name = region['name']
+        if name in durations:
+            print('{:<24}{:>8.1f}s'.format(name, durations[name]))
+        else:
+            print('{:<24}{:>9}'.format(name, 'failed'))
+    print('{:<24}{:>8.1f}s'.format('total:', sum(durations.values())))
+    print('{:<24}{:>8.1f}s'.format('wall time:', wall_time))
+
+    if len(failures) > 0:
+        raise Exception(
+            'Failed to render %s' % ', '.join(sorted(failures.keys()))
+        )
+
+
+if __name__ == '__main__':
+    render()
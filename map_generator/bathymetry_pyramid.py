@@ -0,0 +1,214 @@
+from functools import lru_cache
+from math import gcd
+from pathlib import Path
+from typing import List, Iterator, Optional, Tuple
+
+import click
+from numpy import ndarray, zeros, median, rint, int16, float64
+
+from bathymetry_sampler import BathymetrySampler, \
+    retrieve_bathymetry_sampler
+from gebco_raster_store import RasterTile, retrieve_raster_tiles
+
+STATISTICS = ['mean', 'min', 'median']
+
+
+def get_level_factors(
+        tiles: List[RasterTile],
+        min_size: int = 16
+) -> List[int]:
+    """
+    Returns how much each level of the pyramid is downsampled by. Each factor
+    is the previous factor multiplied by the smallest prime that still
+    divides every tile evenly, so that no block straddles a tile's edge.
+    """
+    divisor = 0
+    for tile in tiles:
+        divisor = gcd(divisor, tile.shape[0], tile.shape[1])
+    min_dimension = min(min(tile.shape) for tile in tiles)
+
+    factors = []
+    factor = 1
+    while True:
+        remaining = divisor // factor
+        prime = next(
+            (p for p in range(2, remaining + 1) if remaining % p == 0),
+            None
+        )
+        if prime is None or min_dimension // (factor * prime) < min_size:
+            return factors
+        factor *= prime
+        factors.append(factor)
+
+
+def reduce_blocks(values: ndarray, factor: int, statistic: str) -> ndarray:
+    """
+    Downsamples an array, whose dimensions are multiples of the factor, by
+    applying the statistic to every factor x factor block.
+    """
+    height, width = values.shape
+    blocks = values\
+        .reshape(height // factor, factor, width // factor, factor)\
+        .swapaxes(1, 2)\
+        .reshape(height // factor, width // factor, factor * factor)
+    if statistic == 'min':
+        return blocks.min(axis=2)
+    elif statistic == 'mean':
+        return rint(blocks.mean(axis=2, dtype=float64)).astype(int16)
+    elif statistic == 'median':
+        return rint(median(blocks, axis=2)).astype(int16)
+    raise Exception('Unknown statistic %s' % statistic)
+
+
+def read_reduced_row_blocks(
+        tile: RasterTile,
+        factor: int,
+        statistic: str,
+        rows_per_block: int = 1024
+) -> Iterator[ndarray]:
+    rows_per_block = factor * max(1, rows_per_block // factor)
+    for row in range(0, tile.shape[0], rows_per_block):
+        yield reduce_blocks(
+            tile.values[row:row + rows_per_block],
+            factor,
+            statistic
+        )
+
+
+def retrieve_level_paths(
+        statistic: str,
+        data_dir: Path = Path('data/gebco_2021_sub_ice_topo_pyramid/')
+) -> List[Path]:
+    level_paths = data_dir.glob('%s_*' % statistic)
+    return sorted(level_paths, key=lambda path: int(path.name.split('_')[1]))
+
+
+class BathymetryPyramid:
+    """
+    Samples bathymetry from a stack of downsampled copies of the GEBCO data,
+    picking for each coordinate the coarsest level whose cells are no larger
+    than the area the coordinate's pixel covers. Each cell holds a statistic
+    of the depths within it, so sampling a level is the same as taking that
+    statistic over the area of the pixel, without aliasing.
+    """
+
+    def __init__(self, levels: List[BathymetrySampler]):
+        self.levels = levels
+
+    def get_level_indices(self, resolutions: ndarray) -> ndarray:
+        """
+        Returns the level to sample each coordinate from, given the
+        resolution in degrees that its pixel spans.
+        """
+        level_indices = zeros(resolutions.size, dtype=int)
+        for i, level in enumerate(self.levels):
+            level_indices[level.pixel_size <= resolutions] = i
+        return level_indices
+
+    def sample(
+            self,
+            longitudes: ndarray,
+            latitudes: ndarray,
+            resolutions: ndarray
+    ) -> ndarray:
+        """
+        Returns the bathymetric value, in meters, for each coordinate, where
+        each coordinate's pixel spans the given resolution in degrees.
+        """
+        return self.sample_with_tile_indices(
+            longitudes,
+            latitudes,
+            resolutions
+        )[0]
+
+    def sample_with_tile_indices(
+            self,
+            longitudes: ndarray,
+            latitudes: ndarray,
+            resolutions: ndarray,
+            previous_tile_indices: Optional[List[int]] = None
+    ) -> Tuple[ndarray, ndarray, ndarray]:
+        """
+        Returns the bathymetric value for each coordinate, alongside the
+        level and the tile within the level it was read from. The previous
+        tile indices are, for each level, the tile that the coordinates
+        before these were last read from, if they were sampled separately.
+        """
+        if previous_tile_indices is None:
+            previous_tile_indices = [-1] * len(self.levels)
+        level_indices = self.get_level_indices(resolutions)
+
+        values = zeros(longitudes.size, dtype=int16)
+        tile_indices = zeros(longitudes.size, dtype=int)
+        for i, level in enumerate(self.levels):
+            selection = level_indices == i
+            if not selection.any():
+                continue
+            values[selection], tile_indices[selection] = \
+                level.sample_with_tile_indices(
+                    longitudes[selection],
+                    latitudes[selection],
+                    previous_tile_indices[i]
+                )
+        return values, level_indices, tile_indices
+
+
+@lru_cache(maxsize=len(STATISTICS))
+def retrieve_bathymetry_pyramid(statistic: str) -> BathymetryPyramid:
+    """
+    Returns the pyramid for the statistic, which like the bathymetry sampler
+    is kept for the lifetime of the process.
+    """
+    levels = [retrieve_bathymetry_sampler()]
+    for level_path in retrieve_level_paths(statistic):
+        levels.append(BathymetrySampler(retrieve_raster_tiles(level_path)))
+    if len(levels) == 1:
+        raise Exception(
+            'Failed to find the %s bathymetry pyramid, which can be built '
+            'with bathymetry_pyramid.py' % statistic
+        )
+    return BathymetryPyramid(levels)
+
+
+@click.command()
+@click.argument(
+    'src',
+    nargs=1,
+    type=click.Path(exists=True, file_okay=False)
+)
+@click.argument(
+    'dst',
+    nargs=1,
+    type=click.Path(exists=False, file_okay=False)
+)
+@click.option(
+    "--statistic",
+    multiple=True,
+    default=STATISTICS,
+    type=click.Choice(STATISTICS, case_sensitive=False),
+    help='The statistic to build levels for. Can be repeated.'
+)
+def build(src: str, dst: str, statistic: List[str]):
+    """
+    Builds downsampled levels from the GEBCO rasters in SRC into DST.
+    """
+    tiles = retrieve_raster_tiles(Path(src))
+    if len(tiles) == 0:
+        raise Exception('Failed to find any rasters in %s' % src)
+    for statistic_name in statistic:
+        for factor in get_level_factors(tiles):
+            level_path = Path(dst).joinpath('%s_%d' % (statistic_name, factor))
+            level_path.mkdir(parents=True, exist_ok=True)
+            for tile in tiles:
+                raster_path = level_path.joinpath(tile.path.name)
+                print(raster_path)
+                RasterTile.write(
+                    raster_path,
+                    tile.bbox,
+                    (tile.shape[0] // factor, tile.shape[1] // factor),
+                    read_reduced_row_blocks(tile, factor, statistic_name)
+                )
+
+
+if __name__ == '__main__':
+    build()
@@ -0,0 +1,222 @@
+from functools import lru_cache
+from pathlib import Path
+from typing import List, Tuple
+
+from geotiff import GeoTiff
+from numpy import ndarray, array, zeros, trunc, stack, argmax, flatnonzero, \
+    arange, int16, int64
+
+from bathymetry_tile import BathymetryTile, GeoTiffTile
+from gebco_raster_store import retrieve_raster_tiles
+from tile_bounds_index import TileBoundsIndex
+
+
+def retrieve_geotiff_paths(
+        data_dir: Path = Path('data/gebco_2021_sub_ice_topo_geotiff/')
+) -> List[Path]:
+    geotiff_paths = sorted(data_dir.glob('*.tif'))
+    if len(geotiff_paths) == 0:
+        raise Exception('Failed to find any geotiffs in %s' % data_dir)
+    return geotiff_paths
+
+
+def retrieve_geotiffs() -> List[GeoTiff]:
+    return list(map(
+        lambda geotiff_path: GeoTiff(geotiff_path.as_posix()),
+        retrieve_geotiff_paths()
+    ))
+
+
+def retrieve_bathymetry_tiles() -> List[BathymetryTile]:
+    """
+    Returns the memory-mapped GEBCO rasters if they have been built by
+    `gebco_raster_store.py`, otherwise falls back to reading the GeoTIFFs.
+    """
+    raster_tiles = retrieve_raster_tiles()
+    if len(raster_tiles) > 0:
+        return raster_tiles
+    return list(map(GeoTiffTile, retrieve_geotiffs()))
+
+
+class BathymetrySampler:
+    """
+    Reads the bathymetric value nearest to each coordinate in an array of
+    WGS84 coordinates, reading from whichever tile contains it.
+
+    The pixel lookup reproduces `GeoTiff.read_box((coord, coord),
+    outer_points=1)` exactly, so that the output matches reading one pixel at
+    a time from the GeoTIFFs.
+    """
+
+    def __init__(self, tiles: List[BathymetryTile]):
+        self.tiles = tiles
+        bboxes = [tile.bbox for tile in tiles]
+        shapes = [tile.shape for tile in tiles]
+        self.tile_bounds_index = TileBoundsIndex(bboxes)
+
+        self.lefts = array([bbox[0][0] for bbox in bboxes])
+        self.tops = array([bbox[0][1] for bbox in bboxes])
+        rights = array([bbox[1][0] for bbox in bboxes])
+        bottoms = array([bbox[1][1] for bbox in bboxes])
+        self.widths = array([shape[1] for shape in shapes])
+        self.heights = array([shape[0] for shape in shapes])
+        self.steps_x = self.widths / (rights - self.lefts)
+        self.steps_y = self.heights / (bottoms - self.tops)
+
+        # The largest size of any tile's pixels, in degrees.
+        self.pixel_size = max(
+            (1 / abs(self.steps_x)).max(),
+            (1 / abs(self.steps_y)).max()
+        )
+
+    def get_pixel_indices(
+            self,
+            tile_indices: ndarray,
+            longitudes: ndarray,
+            latitudes: ndarray
+    ) -> Tuple[ndarray, ndarray, ndarray]:
+        """
+        Returns the row and column of every coordinate within the given
+        tiles, and whether that tile can be read from at that coordinate. A
+        tile index of -1 is never readable.
+        """
+        lefts = self.lefts[tile_indices]
+        tops = self.tops[tile_indices]
+
+        # The same integer arithmetic as `GeoTiff.get_int_box()`, where the
+        # top-left of the box is bumped one pixel unless it lies on the
+        # tile's edge, then pushed back by the outer point.
+        col = trunc(self.steps_x[tile_indices] * (longitudes - lefts))
+        row = trunc(self.steps_y[tile_indices] * (latitudes - tops))
+        col = col.astype(int64)
+        row = row.astype(int64)
+        cols = col + (longitudes != lefts) - 1
+        rows = row + (latitudes != tops) - 1
+        readable = (
+            (tile_indices >= 0) &
+            (cols >= 0) &
+            (rows >= 0) &
+            (col < self.widths[tile_indices]) &
+            (row < self.heights[tile_indices])
+        )
+        return rows, cols, readable
+
+    def lookup_tile_indices(
+            self,
+            longitudes: ndarray,
+            latitudes: ndarray,
+            previous_tile_index: int = -1
+    ) -> Tuple[ndarray, ndarray, ndarray]:
+        """
+        Picks which tile to read from for each coordinate, and returns it
+        alongside the row and column to read. The previous tile index is the
+        tile of the coordinate before the first one, if it was sampled
+        separately.
+        """
+        # A tile can also be read from up to a pixel west and north of its
+        # bounding box, so the tiles a pixel east and south of each
+        # coordinate are candidates too.
+        candidates = stack([
+            self.tile_bounds_index.lookup(
+                longitudes + offset_x,
+                latitudes - offset_y
+            )
+            for offset_x, offset_y in (
+                (0, 0),
+                (self.pixel_size, 0),
+                (0, self.pixel_size),
+                (self.pixel_size, self.pixel_size)
+            )
+        ])
+        rows, cols, readable = self.get_pixel_indices(
+            candidates,
+            longitudes,
+            latitudes
+        )
+
+        missing = flatnonzero(~readable.any(axis=0))
+        if missing.size > 0:
+            raise Exception(
+                'Failed to lookup tile for (%f, %f)' %
+                (longitudes[missing[0]], latitudes[missing[0]])
+            )
+
+        # Prefer the tile containing the coordinate, otherwise the first
+        # candidate that can be read from.
+        choices = argmax(readable, axis=0)
+        coord_indices = arange(longitudes.size)
+        tile_indices = candidates[choices, coord_indices]
+
+        # Coordinates within a pixel of the edge between two tiles can be
+        # read from either. Pixel-by-pixel rendering kept reading from the
+        # previous coordinate's tile for as long as it could, so the same
+        # is done here.
+        ambiguous = flatnonzero(
+            (readable & (candidates != tile_indices)).any(axis=0)
+        )
+        for i in ambiguous:
+            previous_tile = \
+                tile_indices[i - 1] if i > 0 else previous_tile_index
+            previous = flatnonzero(
+                readable[:, i] & (candidates[:, i] == previous_tile)
+            )
+            if previous.size > 0:
+                choices[i] = previous[0]
+                tile_indices[i] = previous_tile
+
+        return (
+            tile_indices,
+            rows[choices, coord_indices],
+            cols[choices, coord_indices]
+        )
+
+    def sample(
+            self,
+            longitudes: ndarray,
+            latitudes: ndarray,
+            previous_tile_index: int = -1
+    ) -> ndarray:
+        """
+        Returns the bathymetric value, in meters, for each coordinate.
+        Coordinates are expected in the order they would be rendered, since
+        it can affect which tile is read from along their edges.
+        """
+        return self.sample_with_tile_indices(
+            longitudes,
+            latitudes,
+            previous_tile_index
+        )[0]
+
+    def sample_with_tile_indices(
+            self,
+            longitudes: ndarray,
+            latitudes: ndarray,
+            previous_tile_index: int = -1
+    ) -> Tuple[ndarray, ndarray]:
+        """
+        Returns the bathymetric value for each coordinate, and the index of
+        the tile it was read from.
+        """
+        tile_indices, rows, cols = self.lookup_tile_indices(
+            longitudes,
+            latitudes,
+            previous_tile_index
+        )
+
+        values = zeros(longitudes.size, dtype=int16)
+        for i, tile in enumerate(self.tiles):
+            selection = tile_indices == i
+            if not selection.any():
+                continue
+            values[selection] = tile.read(rows[selection], cols[selection])
+        return values, tile_indices
+
+
+@lru_cache(maxsize=1)
+def retrieve_bathymetry_sampler() -> BathymetrySampler:
+    """
+    Returns a sampler over the bathymetry tiles. The tiles are opened once
+    and kept for the lifetime of the process, so that rendering several maps
+    in one process only opens the data once.
+    """
+    return BathymetrySampler(retrieve_bathymetry_tiles())
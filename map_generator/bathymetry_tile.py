@@ -0,0 +1,37 @@
+from abc import ABC, abstractmethod
+from typing import Tuple
+
+from geotiff import GeoTiff
+from numpy import ndarray
+
+BBox = Tuple[Tuple[float, float], Tuple[float, float]]
+
+
+class BathymetryTile(ABC):
+    """
+    A grid of bathymetric values covering a WGS84 bounding box, which can be
+    read from at arbitrary pixel positions.
+    """
+    bbox: BBox
+    shape: Tuple[int, int]
+
+    @abstractmethod
+    def read(self, rows: ndarray, cols: ndarray) -> ndarray:
+        """
+        Returns the value at each (row, col) position.
+        """
+
+
+class GeoTiffTile(BathymetryTile):
+    """
+    Reads bathymetric values directly from a GeoTIFF, decoding whichever
+    chunks of the GeoTIFF are needed.
+    """
+
+    def __init__(self, geotiff: GeoTiff):
+        self.geotiff = geotiff
+        self.bbox = geotiff.tif_bBox
+        self.shape = tuple(geotiff.tif_shape)
+
+    def read(self, rows: ndarray, cols: ndarray) -> ndarray:
+        return self.geotiff.read().get_coordinate_selection((rows, cols))
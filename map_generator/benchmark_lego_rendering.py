@@ -0,0 +1,112 @@
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Tuple
+
+import click
+from map_engraver.canvas import Canvas
+from map_engraver.canvas.canvas_unit import CanvasUnit
+from map_engraver.drawable.geometry.polygon_drawer import PolygonDrawer
+from numpy import ndarray
+from numpy.random import default_rng
+from shapely.geometry import Point
+
+from palette import PALETTE, STUD_RADIUS
+from step_6_pixels_to_lego import build_lego_canvas, draw_studs
+
+
+def draw_studs_as_polygons(canvas: Canvas, image: ndarray):
+    # How step 6 used to draw the tiles, buffering a point into a polygon
+    # and drawing it separately for every pixel.
+    height, width = image.shape
+    polygon_drawer = PolygonDrawer()
+    for y in range(height):
+        for x in range(width):
+            color = PALETTE[image[y, x]]
+
+            x_pt = CanvasUnit.from_px(x + 0.5).pt
+            y_pt = CanvasUnit.from_px(y + 0.5).pt
+            size_pt = CanvasUnit.from_px(STUD_RADIUS).pt
+            polygon_drawer.geoms = [
+                Point(x_pt, y_pt).buffer(size_pt)
+            ]
+            polygon_drawer.fill_color = (
+                color[0]/255,
+                color[1]/255,
+                color[2]/255,
+                1
+            )
+            polygon_drawer.draw(canvas)
+
+
+def time_runs(
+        runs: int,
+        image: ndarray,
+        draw: Callable[[Canvas, ndarray], None]
+) -> float:
+    """
+    Returns the average number of seconds it takes to draw the image and
+    save it as a PNG.
+    """
+    height, width = image.shape
+    with tempfile.TemporaryDirectory() as output_dir:
+        output_filepath = Path(output_dir).joinpath('lego.png')
+        start = time.perf_counter()
+        for _ in range(runs):
+            canvas = build_lego_canvas(width, height, output_filepath)
+            draw(canvas, image)
+            canvas.close()
+        return (time.perf_counter() - start) / runs
+
+
+def parse_size(ctx, param, value: str) -> Tuple[int, int]:
+    width, height = value.split(',')
+    return int(width), int(height)
+
+
+@click.command()
+@click.option(
+    "--size",
+    default='128,80',
+    callback=parse_size,
+    help='The width and height of the mosaic in tiles.'
+)
+@click.option(
+    "--runs",
+    default=5,
+    type=click.INT,
+    help='The number of times to render the mosaic.'
+)
+@click.option(
+    "--polygons/--no-polygons",
+    default=True,
+    help='Also times drawing every tile as a separate polygon, which is '
+         'slow for large mosaics.'
+)
+def benchmark(
+        size: Tuple[int, int],
+        runs: int,
+        polygons: bool
+):
+    """
+    Times how long step 6 takes to render a mosaic of random tiles, per 10k
+    tiles, drawing the tiles of each color as one path of arcs, and as one
+    polygon per tile like step 6 used to.
+    """
+    width, height = size
+    image = default_rng(0).integers(0, len(PALETTE), (height, width))
+    per_10k_studs = 10000 / (width * height)
+
+    arc_time = time_runs(runs, image, draw_studs)
+    print('Arcs: %.1fms per 10k studs' % (arc_time * per_10k_studs * 1000))
+    if polygons:
+        polygon_time = time_runs(runs, image, draw_studs_as_polygons)
+        print(
+            'Polygons: %.1fms per 10k studs' %
+            (polygon_time * per_10k_studs * 1000)
+        )
+        print('Speed-up: %.1fx' % (polygon_time / arc_time))
+
+
+if __name__ == '__main__':
+    benchmark()
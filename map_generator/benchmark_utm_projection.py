@@ -0,0 +1,108 @@
+import time
+from typing import Callable, Tuple
+
+import click
+from map_engraver.canvas.canvas_unit import CanvasUnit
+
+import utm_projection_transformer_builder
+from utm_projection_transformer_builder import UtmProjectionTransformerBuilder
+
+
+def clear_caches():
+    utm_projection_transformer_builder.get_utm_crs.cache_clear()
+    utm_projection_transformer_builder.get_wgs84_to_utm_transformer\
+        .cache_clear()
+    utm_projection_transformer_builder.get_utm_to_wgs84_transformer\
+        .cache_clear()
+
+
+def build_transformers(builder: UtmProjectionTransformerBuilder):
+    # The same projection work that steps 1 and 4 do before rendering.
+    builder.get_wgs84_bbox()
+    builder.build_wgs84_to_utm_on_canvas_vectorized()
+    builder.build_utm_on_canvas_to_wgs84_vectorized()
+
+
+def time_runs(runs: int, run: Callable[[], None]) -> float:
+    start = time.perf_counter()
+    for _ in range(runs):
+        run()
+    return (time.perf_counter() - start) / runs
+
+
+def parse_size(ctx, param, value: str) -> Tuple[int, int]:
+    width, height = value.split(',')
+    return int(width), int(height)
+
+
+def parse_center(ctx, param, value: str) -> Tuple[float, float]:
+    longitude, latitude = value.split(',')
+    return float(longitude), float(latitude)
+
+
+@click.command()
+@click.option(
+    "--size",
+    default='80,128',
+    callback=parse_size,
+    help='The width and height of the canvas in pixels.'
+)
+@click.option(
+    "--center",
+    default='1.8,58.8',
+    callback=parse_center,
+    help='The longitude and latitude to center the map on.'
+)
+@click.option(
+    "--scale",
+    default=15000.0,
+    type=click.FLOAT,
+    help='The number of meters a pixel represents.'
+)
+@click.option(
+    "--rotation",
+    default=25.0,
+    type=click.FLOAT,
+    help='The rotation of the map in degrees.'
+)
+@click.option(
+    "--runs",
+    default=20,
+    type=click.INT,
+    help='The number of times to build the transformers.'
+)
+def benchmark(
+        size: Tuple[int, int],
+        center: Tuple[float, float],
+        scale: float,
+        rotation: float,
+        runs: int
+):
+    """
+    Times how long it takes to set up the UTM projection for a map, with the
+    CRS and transformer caches cleared before every run (as if each run was
+    a new process) and with them kept warm (as in a batch of runs).
+    """
+    def build():
+        build_transformers(UtmProjectionTransformerBuilder(
+            CanvasUnit.from_px(size[0]),
+            CanvasUnit.from_px(size[1]),
+            center[0],
+            center[1],
+            scale,
+            rotation
+        ))
+
+    def build_cold():
+        clear_caches()
+        build()
+
+    cold = time_runs(runs, build_cold)
+    warm = time_runs(runs, build)
+    print('Cold caches: %.2fms per run' % (cold * 1000))
+    print('Warm caches: %.2fms per run' % (warm * 1000))
+    print('Speed-up: %.1fx' % (cold / warm))
+
+
+if __name__ == '__main__':
+    benchmark()
@@ -1,6 +1,8 @@
 import csv
 from pathlib import Path
-from typing import Dict
+from typing import Dict, List
+
+from numpy import ndarray, zeros
 
 
 class BrightnessTileProportions:
@@ -72,3 +74,19 @@ class BrightnessTileProportions:
                                                 tile_proportion_sum
 
         return proportions
+
+    @staticmethod
+    def to_matrix(
+            proportions: Dict[int, Dict[str, float]],
+            tiles: List[str]
+    ) -> ndarray:
+        """
+        Converts the proportions into a (brightness x tile) matrix, for each
+        of the 256 brightness levels and the given tiles. Brightness levels
+        without any proportions are left as zeros.
+        """
+        matrix = zeros((256, len(tiles)))
+        for brightness, tile_proportions in proportions.items():
+            for t_i, tile in enumerate(tiles):
+                matrix[brightness, t_i] = tile_proportions.get(tile, 0)
+        return matrix
@@ -0,0 +1,246 @@
+from functools import lru_cache
+from pathlib import Path
+from struct import Struct
+from typing import List, Optional, Tuple, Iterable
+
+import click
+import shapefile
+import shapely
+from numpy import ndarray, memmap, fromfile, dtype, array, arange, cumsum, \
+    concatenate, flatnonzero, zeros
+from shapely.geometry import shape
+from shapely.geometry.base import BaseGeometry
+
+# Each store is a small header, followed by the bounding box of every
+# feature, the offset of every feature's WKB and then the WKB itself, so that
+# the bounding boxes can be searched without decoding any of the features.
+# The header records the size and modification time of the shapefile the
+# store was built from, to tell when the shapefile has been replaced.
+HEADER = Struct('<8sQQq')
+HEADER_SIZE = 32
+MAGIC = b'COASTWKB'
+BBOX_DTYPE = dtype('<f8')
+OFFSET_DTYPE = dtype('<u8')
+
+BBox = Tuple[float, float, float, float]
+
+
+class CoastlineStore:
+    """
+    Reads the features of a Natural Earth layer from a file written by
+    `write()`. The WKB is memory-mapped, and a feature is only decoded the
+    first time it is read.
+    """
+
+    def __init__(self, path: Path):
+        with open(path.as_posix(), 'rb') as file:
+            magic, count, _, _ = HEADER.unpack(file.read(HEADER.size))
+            if magic != MAGIC:
+                raise Exception('%s is not a coastline store' % path)
+            file.seek(HEADER_SIZE)
+            self.bboxes = fromfile(file, dtype=BBOX_DTYPE, count=count * 4)\
+                .reshape(count, 4)
+            self.offsets = fromfile(file, dtype=OFFSET_DTYPE, count=count + 1)
+
+        self.path = path
+        self.count = count
+        wkb_offset = HEADER_SIZE + \
+            self.bboxes.nbytes + \
+            self.offsets.nbytes
+        if self.offsets[-1] > 0:
+            self.wkb = memmap(
+                path.as_posix(),
+                dtype='u1',
+                mode='r',
+                offset=wkb_offset,
+                shape=(int(self.offsets[-1]),)
+            )
+        else:
+            self.wkb = zeros(0, dtype='u1')
+        self.geometries: List[Optional[BaseGeometry]] = [None] * count
+
+    def query(self, bbox: Optional[BBox] = None) -> ndarray:
+        """
+        Returns the index of every feature, in the order they were written,
+        or if a bbox is given, only of the features whose bounding box
+        overlaps it.
+        """
+        if bbox is None:
+            return arange(self.count)
+        # The same overlap test as pyshp's, which includes bounding boxes that
+        # only touch.
+        return flatnonzero(
+            (self.bboxes[:, 0] <= bbox[2]) &
+            (self.bboxes[:, 2] >= bbox[0]) &
+            (self.bboxes[:, 1] <= bbox[3]) &
+            (self.bboxes[:, 3] >= bbox[1])
+        )
+
+    def get(self, index: int) -> BaseGeometry:
+        if self.geometries[index] is None:
+            start = self.offsets[index]
+            end = self.offsets[index + 1]
+            self.geometries[index] = shapely.from_wkb(
+                self.wkb[start:end].tobytes()
+            )
+        return self.geometries[index]
+
+    def read(self, bbox: Optional[BBox] = None) -> List[BaseGeometry]:
+        return [self.get(index) for index in self.query(bbox)]
+
+    @staticmethod
+    def write(
+            path: Path,
+            geometries: Iterable[BaseGeometry],
+            source_size: int,
+            source_mtime_ns: int
+    ):
+        """
+        Writes a store file of the geometries, in the order they are given,
+        along with the size and modification time of their shapefile.
+        """
+        geometries = list(geometries)
+        wkbs = [shapely.to_wkb(geometry) for geometry in geometries]
+        bboxes = array(
+            [geometry.bounds for geometry in geometries],
+            dtype=BBOX_DTYPE
+        ).reshape(len(geometries), 4)
+        offsets = concatenate([
+            [0],
+            cumsum([len(wkb) for wkb in wkbs], dtype=OFFSET_DTYPE)
+        ]).astype(OFFSET_DTYPE)
+
+        # Write to a temporary file first, so an interrupted conversion never
+        # leaves a store behind that looks complete.
+        partial_path = path.with_name(path.name + '.part')
+        header = HEADER.pack(
+            MAGIC,
+            len(geometries),
+            source_size,
+            source_mtime_ns
+        )
+        with open(partial_path.as_posix(), 'wb') as file:
+            file.write(header.ljust(HEADER_SIZE, b'\0'))
+            file.write(bboxes.tobytes())
+            file.write(offsets.tobytes())
+            for wkb in wkbs:
+                file.write(wkb)
+        partial_path.replace(path)
+
+
+def read_source_stat(store_path: Path) -> Tuple[int, int]:
+    """
+    Returns the size and modification time of the shapefile the store was
+    built from, without reading the rest of the store.
+    """
+    with open(store_path.as_posix(), 'rb') as file:
+        _, _, source_size, source_mtime_ns = \
+            HEADER.unpack(file.read(HEADER.size))
+    return source_size, source_mtime_ns
+
+
+def read_shapefile_geometries(
+        shapefile_collection: shapefile.Reader,
+        bbox: Optional[BBox] = None
+) -> List[BaseGeometry]:
+    shapely_objects = []
+    for shapefile_shape in shapefile_collection.iterShapes(bbox=bbox):
+        shapely_objects.append(shape(shapefile_shape.__geo_interface__))
+    return shapely_objects
+
+
+@lru_cache(maxsize=4)
+def open_shapefile(shapefile_path: Path) -> shapefile.Reader:
+    """
+    Opens the shapefile, which is kept open for the lifetime of the process,
+    so that every map rendered by a batch worker reads from the same reader.
+    """
+    return shapefile.Reader(shapefile_path.as_posix())
+
+
+@lru_cache(maxsize=4)
+def parse_whole_shapefile(shapefile_path: Path) -> List[BaseGeometry]:
+    """
+    Reads every shape in the shapefile. The shapes are kept for the lifetime
+    of the process, so the returned list must not be modified.
+    """
+    return read_shapefile_geometries(open_shapefile(shapefile_path))
+
+
+def get_store_path(shapefile_path: Path) -> Path:
+    return shapefile_path.with_suffix('.wkb')
+
+
+@lru_cache(maxsize=4)
+def retrieve_coastline_store(shapefile_path: Path) -> Optional[CoastlineStore]:
+    """
+    Returns the store built next to the shapefile, or None if it has not been
+    built, or if the shapefile has been replaced since. Unzipping sets the
+    modification time from the archive, so the shapefile can be older than a
+    store built before it was downloaded again. Instead, the store is only
+    used while the shapefile still has the size and modification time it
+    had when the store was built.
+    """
+    store_path = get_store_path(shapefile_path)
+    if not store_path.exists():
+        return None
+    stat = shapefile_path.stat()
+    if read_source_stat(store_path) != (stat.st_size, stat.st_mtime_ns):
+        print(
+            'Ignoring %s, as %s has changed since it was built' %
+            (store_path, shapefile_path)
+        )
+        return None
+    return CoastlineStore(store_path)
+
+
+def parse_shapefile(
+        shapefile_path: Path,
+        bbox: Optional[BBox] = None
+) -> List[BaseGeometry]:
+    """
+    Reads every shape in the shapefile, or if a WGS84 bbox is given, only the
+    shapes whose bounding box overlaps it. If a store has been built for the
+    shapefile, the shapes are decoded from the store instead of being parsed,
+    and the store keeps every shape it decodes for the next map. Otherwise,
+    the shapefile is kept open for the next map, and if every shape is read,
+    the shapes are kept too, so the returned list must not be modified.
+    """
+    store = retrieve_coastline_store(shapefile_path)
+    if store is not None:
+        return store.read(bbox)
+    if bbox is None:
+        return parse_whole_shapefile(shapefile_path)
+    return read_shapefile_geometries(open_shapefile(shapefile_path), bbox)
+
+
+@click.command()
+@click.argument(
+    'src',
+    nargs=-1,
+    type=click.Path(exists=True, dir_okay=False)
+)
+def build(src: Tuple[str, ...]):
+    """
+    Converts every shapefile in SRC into a store next to the shapefile, which
+    step 1 reads instead of parsing the shapefile.
+    """
+    for shapefile_path in map(Path, src):
+        store_path = get_store_path(shapefile_path)
+        print(store_path)
+        # The shapefile is stat'ed before it is read, so that if it is
+        # replaced while it is read, the store is treated as out of date.
+        stat = shapefile_path.stat()
+        with shapefile.Reader(shapefile_path.as_posix()) as \
+                shapefile_collection:
+            geometries = read_shapefile_geometries(shapefile_collection)
+        CoastlineStore.write(
+            store_path,
+            geometries,
+            stat.st_size,
+            stat.st_mtime_ns
+        )
+
+
+if __name__ == '__main__':
+    build()
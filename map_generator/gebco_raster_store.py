@@ -0,0 +1,151 @@
+from pathlib import Path
+from struct import Struct
+from typing import List, Tuple, Iterable, Iterator
+
+import click
+from geotiff import GeoTiff
+from numpy import ndarray, memmap, dtype
+
+from bathymetry_tile import BathymetryTile, BBox
+
+# Each raster is a small header followed by the uncompressed values, row by
+# row, so that the values can be memory-mapped straight from the file.
+HEADER = Struct('<8sIIdddd')
+HEADER_SIZE = 64
+MAGIC = b'GEBCORAS'
+VALUE_DTYPE = dtype('<i2')
+
+
+class RasterTile(BathymetryTile):
+    """
+    Reads bathymetric values from a raster file written by `write()`. Values
+    are memory-mapped, so only the pages that are read are loaded into memory.
+    """
+
+    def __init__(self, path: Path):
+        with open(path.as_posix(), 'rb') as file:
+            magic, width, height, west, north, east, south = \
+                HEADER.unpack(file.read(HEADER.size))
+        if magic != MAGIC:
+            raise Exception('%s is not a GEBCO raster' % path)
+
+        self.path = path
+        self.bbox = ((west, north), (east, south))
+        self.shape = (height, width)
+        self.values = memmap(
+            path.as_posix(),
+            dtype=VALUE_DTYPE,
+            mode='r',
+            offset=HEADER_SIZE,
+            shape=self.shape
+        )
+
+    def read(self, rows: ndarray, cols: ndarray) -> ndarray:
+        # Slicing a memmap does not copy anything, so the positions are read
+        # from a view of the window that covers them.
+        row_min = rows.min()
+        col_min = cols.min()
+        window = self.values[
+            row_min:rows.max() + 1,
+            col_min:cols.max() + 1
+        ]
+        return window[rows - row_min, cols - col_min]
+
+    @staticmethod
+    def write(
+            path: Path,
+            bbox: BBox,
+            shape: Tuple[int, int],
+            row_blocks: Iterable[ndarray]
+    ):
+        """
+        Writes a raster file covering the bounding box, with the given
+        (height, width), from consecutive blocks of rows of values.
+        """
+        (west, north), (east, south) = bbox
+        height, width = shape
+
+        # Write to a temporary file first, so an interrupted conversion never
+        # leaves a raster behind that looks complete.
+        partial_path = path.with_name(path.name + '.part')
+        header = HEADER.pack(MAGIC, width, height, west, north, east, south)
+        with open(partial_path.as_posix(), 'wb') as file:
+            file.write(header.ljust(HEADER_SIZE, b'\0'))
+
+        values = memmap(
+            partial_path.as_posix(),
+            dtype=VALUE_DTYPE,
+            mode='r+',
+            offset=HEADER_SIZE,
+            shape=shape
+        )
+        row = 0
+        for row_block in row_blocks:
+            values[row:row + row_block.shape[0]] = row_block
+            row += row_block.shape[0]
+        if row != height:
+            raise Exception(
+                'Expected %d rows for %s, found %d' % (height, path, row)
+            )
+        values.flush()
+        del values
+        partial_path.replace(path)
+
+
+def read_geotiff_row_blocks(
+        geotiff: GeoTiff,
+        rows_per_block: int = 1024
+) -> Iterator[ndarray]:
+    source = geotiff.read()
+    if source.dtype != VALUE_DTYPE:
+        raise Exception(
+            'Expected %s to contain int16 values, found %s' %
+            (geotiff.file, source.dtype)
+        )
+    for row in range(0, source.shape[0], rows_per_block):
+        yield source[row:row + rows_per_block]
+
+
+def retrieve_raster_paths(
+        data_dir: Path = Path('data/gebco_2021_sub_ice_topo_raster/')
+) -> List[Path]:
+    return sorted(data_dir.glob('*.raster'))
+
+
+def retrieve_raster_tiles(
+        data_dir: Path = Path('data/gebco_2021_sub_ice_topo_raster/')
+) -> List[RasterTile]:
+    return list(map(RasterTile, retrieve_raster_paths(data_dir)))
+
+
+@click.command()
+@click.argument(
+    'src',
+    nargs=1,
+    type=click.Path(exists=True, file_okay=False)
+)
+@click.argument(
+    'dst',
+    nargs=1,
+    type=click.Path(exists=False, file_okay=False)
+)
+def build(src: str, dst: str):
+    """
+    Converts every GeoTIFF in SRC into a memory-mappable raster in DST.
+    """
+    dst_path = Path(dst)
+    dst_path.mkdir(parents=True, exist_ok=True)
+    for geotiff_path in sorted(Path(src).glob('*.tif')):
+        raster_path = dst_path.joinpath(geotiff_path.stem + '.raster')
+        print(raster_path)
+        geotiff = GeoTiff(geotiff_path.as_posix())
+        RasterTile.write(
+            raster_path,
+            geotiff.tif_bBox,
+            tuple(geotiff.tif_shape),
+            read_geotiff_row_blocks(geotiff)
+        )
+
+
+if __name__ == '__main__':
+    build()
@@ -0,0 +1,250 @@
+import struct
+import zlib
+from pathlib import Path
+from typing import BinaryIO, Iterator, Tuple
+
+import tifffile
+from PIL import Image
+from numpy import ndarray, array, asarray, concatenate, cumsum, frombuffer, \
+    full, repeat, zeros, uint8
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+# The number of samples in each pixel of an 8-bit PNG, by its color type.
+PNG_CHANNELS = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}
+
+# The filter type that stores each row as its difference to the row above.
+PNG_UP_FILTER = 2
+
+
+def read_png_chunks(file: BinaryIO) -> Iterator[Tuple[bytes, bytes]]:
+    """
+    Yields the type and data of each chunk of a PNG, up to the IEND chunk.
+    """
+    if file.read(len(PNG_SIGNATURE)) != PNG_SIGNATURE:
+        raise Exception('%s is not a PNG' % file.name)
+    while True:
+        length, chunk_type = struct.unpack('>I4s', file.read(8))
+        data = file.read(length)
+        # Skip the CRC.
+        file.read(4)
+        yield chunk_type, data
+        if chunk_type == b'IEND':
+            return
+
+
+def write_png_chunk(file: BinaryIO, chunk_type: bytes, data: bytes):
+    file.write(struct.pack('>I', len(data)))
+    file.write(chunk_type)
+    file.write(data)
+    file.write(struct.pack('>I', zlib.crc32(chunk_type + data)))
+
+
+def unfilter_png_row(
+        filter_type: int,
+        row: ndarray,
+        previous_row: ndarray,
+        pixel_size: int
+) -> ndarray:
+    """
+    Reverses the filter that a row of an 8-bit PNG was stored with, where the
+    previous row has already been unfiltered.
+    """
+    if filter_type == 0:
+        return row
+    if filter_type == 1:
+        return cumsum(row.reshape(-1, pixel_size), axis=0, dtype=uint8) \
+            .reshape(-1)
+    if filter_type == 2:
+        return row + previous_row
+
+    # The average and Paeth filters depend on the unfiltered byte to the
+    # left, so they are reversed one byte at a time.
+    current = row.tolist()
+    above = previous_row.tolist()
+    if filter_type == 3:
+        for i in range(len(current)):
+            left = current[i - pixel_size] if i >= pixel_size else 0
+            current[i] = (current[i] + ((left + above[i]) >> 1)) & 255
+    elif filter_type == 4:
+        for i in range(len(current)):
+            if i >= pixel_size:
+                left = current[i - pixel_size]
+                upper_left = above[i - pixel_size]
+            else:
+                left = upper_left = 0
+            estimate = left + above[i] - upper_left
+            distance_left = abs(estimate - left)
+            distance_above = abs(estimate - above[i])
+            distance_upper_left = abs(estimate - upper_left)
+            if distance_left <= distance_above and \
+                    distance_left <= distance_upper_left:
+                predictor = left
+            elif distance_above <= distance_upper_left:
+                predictor = above[i]
+            else:
+                predictor = upper_left
+            current[i] = (current[i] + predictor) & 255
+    else:
+        raise Exception('Unexpected PNG filter type %d' % filter_type)
+    return array(current, dtype=uint8)
+
+
+def read_png_rows(file: BinaryIO) -> Iterator[ndarray]:
+    """
+    Yields each row of an 8-bit, non-interlaced PNG as RGB, decoding the
+    image a row at a time. Any other image is read in full by PIL instead.
+    """
+    palette = None
+    row_size = 0
+    previous_row = None
+    decompressor = zlib.decompressobj()
+    buffer = bytearray()
+
+    def to_rgb(row: ndarray) -> ndarray:
+        if color_type == 0:
+            return repeat(row[:, None], 3, axis=1)
+        if color_type == 2:
+            return row.reshape(-1, 3)
+        if color_type == 3:
+            return palette[row]
+        if color_type == 4:
+            return repeat(row.reshape(-1, 2)[:, :1], 3, axis=1)
+        return row.reshape(-1, 4)[:, :3]
+
+    for chunk_type, data in read_png_chunks(file):
+        if chunk_type == b'IHDR':
+            width, _, bit_depth, color_type, _, _, interlace = \
+                struct.unpack('>IIBBBBB', data)
+            if bit_depth != 8 or interlace != 0:
+                file.seek(0)
+                with Image.open(file) as image:
+                    yield from asarray(image.convert('RGB'))
+                return
+            pixel_size = PNG_CHANNELS[color_type]
+            row_size = width * pixel_size
+            previous_row = zeros(row_size, dtype=uint8)
+        elif chunk_type == b'PLTE':
+            # Indices past the end of the palette are black.
+            palette = zeros((256, 3), dtype=uint8)
+            colors = frombuffer(data, dtype=uint8).reshape(-1, 3)
+            palette[:colors.shape[0]] = colors
+        elif chunk_type == b'IDAT':
+            # Decompress a few rows at a time, since a small chunk of a
+            # plain image can decompress to a large number of rows.
+            while len(data) > 0:
+                buffer += decompressor.decompress(data, (row_size + 1) * 16)
+                data = decompressor.unconsumed_tail
+                while len(buffer) > row_size:
+                    filter_type = buffer[0]
+                    row = array(buffer[1:row_size + 1], dtype=uint8)
+                    del buffer[:row_size + 1]
+                    row = unfilter_png_row(
+                        filter_type,
+                        row,
+                        previous_row,
+                        pixel_size
+                    )
+                    previous_row = row
+                    yield to_rgb(row)
+
+
+def read_rgb_bands(path: Path, band_height: int) -> Iterator[ndarray]:
+    """
+    Yields the image as RGB bands of rows, the last of which may be shorter.
+    PNGs are decoded a band at a time, so only a band is held in memory.
+    """
+    with open(path.as_posix(), 'rb') as file:
+        if path.suffix.lower() == '.png':
+            rows = read_png_rows(file)
+        else:
+            with Image.open(file) as image:
+                rows = iter(asarray(image.convert('RGB')))
+        band = []
+        for row in rows:
+            band.append(row)
+            if len(band) == band_height:
+                yield array(band)
+                band = []
+        if len(band) > 0:
+            yield array(band)
+
+
+def write_png_bands(
+        path: Path,
+        width: int,
+        height: int,
+        bands: Iterator[ndarray]
+):
+    """
+    Saves the bands of a grayscale image as a PNG, encoding each band as it
+    is yielded.
+    """
+    with open(path.as_posix(), 'wb') as file:
+        file.write(PNG_SIGNATURE)
+        write_png_chunk(
+            file,
+            b'IHDR',
+            struct.pack('>IIBBBBB', width, height, 8, 0, 0, 0, 0)
+        )
+        compressor = zlib.compressobj()
+        previous_row = zeros(width, dtype=uint8)
+        for band in bands:
+            rows = concatenate([previous_row[None, :], band])
+            filter_types = full((band.shape[0], 1), PNG_UP_FILTER, dtype=uint8)
+            data = compressor.compress(
+                concatenate([filter_types, rows[1:] - rows[:-1]], axis=1)
+                .tobytes()
+            )
+            if len(data) > 0:
+                write_png_chunk(file, b'IDAT', data)
+            previous_row = band[-1]
+        write_png_chunk(file, b'IDAT', compressor.flush())
+        write_png_chunk(file, b'IEND', b'')
+
+
+def get_tiff_tiles(
+        bands: Iterator[ndarray],
+        tile_shape: Tuple[int, int]
+) -> Iterator[ndarray]:
+    """
+    Regroups the bands of an image into tiles that span the width of the
+    image, padding the right and bottom edges with zeros.
+    """
+    tile = zeros(tile_shape, dtype=uint8)
+    tile_row = 0
+    for band in bands:
+        for row in band:
+            tile[tile_row, :row.size] = row
+            tile_row += 1
+            if tile_row == tile_shape[0]:
+                yield tile
+                tile = zeros(tile_shape, dtype=uint8)
+                tile_row = 0
+    if tile_row > 0:
+        yield tile
+
+
+def write_grayscale_bands(
+        path: Path,
+        width: int,
+        height: int,
+        bands: Iterator[ndarray]
+):
+    """
+    Saves the bands of a grayscale image as a TIFF if the path ends in .tif
+    or .tiff, otherwise as a PNG, encoding each band as it is yielded.
+    """
+    if path.suffix.lower() in ['.tif', '.tiff']:
+        # The dimensions of TIFF tiles must be multiples of 16.
+        tile_shape = (16, -(-width // 16) * 16)
+        tifffile.imwrite(
+            path.as_posix(),
+            get_tiff_tiles(bands, tile_shape),
+            shape=(height, width),
+            dtype=uint8,
+            tile=tile_shape,
+            compression='zlib'
+        )
+    else:
+        write_png_bands(path, width, height, bands)
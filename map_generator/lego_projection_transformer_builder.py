@@ -1,8 +1,13 @@
-from math import isclose
-
 from typing import Tuple, Callable, TypedDict, List
 
 from map_engraver.canvas.canvas_unit import CanvasUnit
+from numpy import ndarray, array, asarray, full, minimum, maximum, \
+    searchsorted, flatnonzero, float64
+from numpy.typing import ArrayLike
+
+# The relative tolerance that `math.isclose()` uses by default, which decides
+# whether a coordinate lies on the edge of a stretch band.
+REL_TOL = 1e-09
 
 
 class StretchRange(TypedDict):
@@ -12,6 +17,14 @@ class StretchRange(TypedDict):
     canvas_range_stop: float
 
 
+def is_close(a: ndarray, b: ndarray) -> ndarray:
+    """
+    An elementwise `math.isclose()`, which unlike `numpy.isclose()` is
+    symmetric and has no absolute tolerance.
+    """
+    return abs(a - b) <= REL_TOL * maximum(abs(a), abs(b))
+
+
 class LegoProjectionTransformerBuilder:
     stretch_bands: List[StretchRange]
 
@@ -55,53 +68,140 @@ class LegoProjectionTransformerBuilder:
             }
         ]
 
+        # The bands are contiguous, so they compile down to their
+        # breakpoints. Latitudes increase and canvas positions decrease from
+        # one band to the next.
+        self.latitude_starts = array([
+            stretch_band['latitude_range_start']
+            for stretch_band in self.stretch_bands
+        ])
+        self.latitude_stops = array([
+            stretch_band['latitude_range_stop']
+            for stretch_band in self.stretch_bands
+        ])
+        self.canvas_starts_pt = array([
+            CanvasUnit.from_px(stretch_band['canvas_range_start']).pt
+            for stretch_band in self.stretch_bands
+        ])
+        self.canvas_stops_pt = array([
+            CanvasUnit.from_px(stretch_band['canvas_range_stop']).pt
+            for stretch_band in self.stretch_bands
+        ])
+
+    def get_wgs84_resolutions(self, y_canvas_px: ndarray) -> ndarray:
+        """
+        Returns the size of a pixel in degrees at each vertical position on
+        the canvas, taking the smaller of its width and height.
+        """
+        resolutions = full(y_canvas_px.shape, 360 / self.canvas_width.px)
+        for stretch_band in self.stretch_bands:
+            in_band = (
+                (stretch_band['canvas_range_start'] >= y_canvas_px) &
+                (y_canvas_px >= stretch_band['canvas_range_stop'])
+            )
+            band_resolution = abs(
+                (
+                    stretch_band['latitude_range_stop'] -
+                    stretch_band['latitude_range_start']
+                ) / (
+                    stretch_band['canvas_range_start'] -
+                    stretch_band['canvas_range_stop']
+                )
+            )
+            resolutions[in_band] = minimum(
+                resolutions[in_band],
+                band_resolution
+            )
+        return resolutions
+
+    def lookup_latitude_bands(self, latitudes: ndarray) -> ndarray:
+        """
+        Returns the stretch band each latitude is projected by, or -1 if no
+        band contains it. Bands include their start, but not their stop.
+        """
+        bands = searchsorted(self.latitude_starts, latitudes, side='right') - 1
+        bands[
+            (bands == -1) & is_close(self.latitude_starts[0], latitudes)
+        ] = 0
+        bands[
+            (bands >= 0) & ~(latitudes < self.latitude_stops[bands])
+        ] = -1
+        return bands
+
+    def lookup_canvas_bands(self, y_canvas: ndarray) -> ndarray:
+        """
+        Returns the stretch band each vertical canvas position, in points, is
+        projected by, or -1 if no band contains it. Bands include both of
+        their edges, and a position on the edge between two bands belongs to
+        the first.
+        """
+        bands = searchsorted(-self.canvas_stops_pt, -y_canvas, side='left')
+        previous_bands = bands - 1
+        on_previous_edge = previous_bands >= 0
+        on_previous_edge[on_previous_edge] = is_close(
+            self.canvas_stops_pt[previous_bands[on_previous_edge]],
+            y_canvas[on_previous_edge]
+        )
+        bands[on_previous_edge] = previous_bands[on_previous_edge]
+        bands[bands == len(self.stretch_bands)] = -1
+        bands[
+            (bands == 0) &
+            ~(self.canvas_starts_pt[0] >= y_canvas) &
+            ~is_close(self.canvas_starts_pt[0], y_canvas)
+        ] = -1
+        return bands
+
     def build_wgs84_to_lego(
             self
     ) -> Callable[[float, float], Tuple[float, float]]:
+        vectorized_transformer = self.build_wgs84_to_lego_vectorized()
+
         def wgs84_to_lego_transformer(
                 longitude: float,
                 latitude: float
         ) -> Tuple[float, float]:
-            x_percentage = (longitude + 180) / 360
-            x_offset = CanvasUnit.from_px(-4)
+            x_canvas, y_canvas = vectorized_transformer(longitude, latitude)
+            return float(x_canvas), float(y_canvas)
+
+        return wgs84_to_lego_transformer
+
+    def build_wgs84_to_lego_vectorized(
+            self
+    ) -> Callable[[ArrayLike, ArrayLike], Tuple[ndarray, ndarray]]:
+        """
+        Builds a transformer that projects arrays of WGS84 coordinates onto
+        the canvas, in points. Since it also accepts sequences, it can be
+        passed straight to `shapely.ops.transform` to project every
+        coordinate of a geometry at once.
+        """
+        x_offset = CanvasUnit.from_px(-4)
+
+        def wgs84_to_lego_transformer(
+                longitudes: ArrayLike,
+                latitudes: ArrayLike
+        ) -> Tuple[ndarray, ndarray]:
+            longitudes = asarray(longitudes, dtype=float64)
+            latitudes = asarray(latitudes, dtype=float64)
+            x_percentage = (longitudes + 180) / 360
             x_canvas = x_percentage * self.canvas_width.pt + x_offset.pt
 
-            min_latitude_range = None
-            max_latitude_range = None
-            min_y_range = None
-            max_y_range = None
-
-            # The latitude mappings below assume that the canvas height is
-            # 80px.
-            for stretch_band in self.stretch_bands:
-                if ((
-                        stretch_band['latitude_range_start'] <= latitude or
-                        isclose(stretch_band['latitude_range_start'], latitude)
-                ) and
-                        latitude < stretch_band['latitude_range_stop']
-                ):
-                    min_latitude_range = stretch_band['latitude_range_start']
-                    max_latitude_range = stretch_band['latitude_range_stop']
-                    min_y_range = CanvasUnit.from_px(
-                        stretch_band['canvas_range_start']
-                    ).pt
-                    max_y_range = CanvasUnit.from_px(
-                        stretch_band['canvas_range_stop']
-                    ).pt
-                    break
-
-            if (
-                    min_latitude_range is None or
-                    max_latitude_range is None or
-                    min_y_range is None or
-                    max_y_range is None
-            ):
+            bands = self.lookup_latitude_bands(latitudes.reshape(-1))\
+                .reshape(latitudes.shape)
+            missing = flatnonzero(bands == -1)
+            if missing.size > 0:
                 raise Exception(
-                    'Coordinate (%f, %f) could not be projected' %
-                    (longitude, latitude)
+                    'Coordinate (%f, %f) could not be projected' % (
+                        longitudes.reshape(-1)[missing[0]],
+                        latitudes.reshape(-1)[missing[0]]
+                    )
                 )
 
-            y_percentage = (latitude - min_latitude_range) / \
+            min_latitude_range = self.latitude_starts[bands]
+            max_latitude_range = self.latitude_stops[bands]
+            min_y_range = self.canvas_starts_pt[bands]
+            max_y_range = self.canvas_stops_pt[bands]
+
+            y_percentage = (latitudes - min_latitude_range) / \
                            (max_latitude_range - min_latitude_range)
             y_canvas = y_percentage * (max_y_range - min_y_range) + min_y_range
             return x_canvas, y_canvas
@@ -111,52 +211,57 @@ class LegoProjectionTransformerBuilder:
     def build_lego_to_wgs84(
             self
     ) -> Callable[[float, float], Tuple[float, float]]:
-        def wgs84_to_lego_transformer(
+        vectorized_transformer = self.build_lego_to_wgs84_vectorized()
+
+        def lego_to_wgs84_transformer(
                 x_canvas_px: float,
                 y_canvas_px: float
         ) -> Tuple[float, float]:
-            x_canvas = CanvasUnit.from_px(x_canvas_px).pt
-            y_canvas = CanvasUnit.from_px(y_canvas_px).pt
-            x_offset = CanvasUnit.from_px(-4/128 * self.canvas_width.px)
+            longitude, latitude = vectorized_transformer(
+                x_canvas_px,
+                y_canvas_px
+            )
+            return float(longitude), float(latitude)
+
+        return lego_to_wgs84_transformer
+
+    def build_lego_to_wgs84_vectorized(
+            self
+    ) -> Callable[[ArrayLike, ArrayLike], Tuple[ndarray, ndarray]]:
+        """
+        Builds a transformer that converts arrays of canvas positions, in
+        pixels, to WGS84 coordinates.
+        """
+        px_to_pt = CanvasUnit.from_px(1).pt
+        x_offset = CanvasUnit.from_px(-4/128 * self.canvas_width.px)
+
+        def lego_to_wgs84_transformer(
+                x_canvas_px: ArrayLike,
+                y_canvas_px: ArrayLike
+        ) -> Tuple[ndarray, ndarray]:
+            x_canvas_px = asarray(x_canvas_px, dtype=float64)
+            y_canvas_px = asarray(y_canvas_px, dtype=float64)
+            x_canvas = x_canvas_px * px_to_pt
+            y_canvas = y_canvas_px * px_to_pt
             x_percentage = (x_canvas - x_offset.pt) / self.canvas_width.pt
             longitude = (x_percentage * 360 + 360) % 360 - 180
 
-            min_latitude_range = None
-            max_latitude_range = None
-            min_y_range = None
-            max_y_range = None
-
-            for stretch_band in self.stretch_bands:
-                canvas_range_start_in_pt = CanvasUnit.from_px(
-                    stretch_band['canvas_range_start']
-                ).pt
-                canvas_range_stop_in_pt = CanvasUnit.from_px(
-                    stretch_band['canvas_range_stop']
-                ).pt
-                if ((
-                        canvas_range_start_in_pt >= y_canvas or
-                        isclose(canvas_range_start_in_pt, y_canvas)
-                ) and (
-                        y_canvas >= canvas_range_stop_in_pt or
-                        isclose(canvas_range_stop_in_pt, y_canvas)
-                )):
-                    min_latitude_range = stretch_band['latitude_range_start']
-                    max_latitude_range = stretch_band['latitude_range_stop']
-                    min_y_range = canvas_range_start_in_pt
-                    max_y_range = canvas_range_stop_in_pt
-                    break
-
-            if (
-                    min_latitude_range is None or
-                    max_latitude_range is None or
-                    min_y_range is None or
-                    max_y_range is None
-            ):
+            bands = self.lookup_canvas_bands(y_canvas.reshape(-1))\
+                .reshape(y_canvas.shape)
+            missing = flatnonzero(bands == -1)
+            if missing.size > 0:
                 raise Exception(
-                    'Coordinate (%f, %f) could not be projected' %
-                    (x_canvas_px, y_canvas_px)
+                    'Coordinate (%f, %f) could not be projected' % (
+                        x_canvas_px.reshape(-1)[missing[0]],
+                        y_canvas_px.reshape(-1)[missing[0]]
+                    )
                 )
 
+            min_latitude_range = self.latitude_starts[bands]
+            max_latitude_range = self.latitude_stops[bands]
+            min_y_range = self.canvas_starts_pt[bands]
+            max_y_range = self.canvas_stops_pt[bands]
+
             y_percentage = (y_canvas - min_y_range)
             y_percentage /= (max_y_range - min_y_range)
             latitude = y_percentage
@@ -164,4 +269,4 @@ class LegoProjectionTransformerBuilder:
             latitude += min_latitude_range
             return longitude, latitude
 
-        return wgs84_to_lego_transformer
+        return lego_to_wgs84_transformer
@@ -0,0 +1,117 @@
+from pathlib import Path
+from typing import List, Tuple, Union
+
+from PIL import Image
+from numpy import ndarray, asarray, array, full, unique, int64, uint8
+
+Color = Tuple[int, int, int]
+
+# The colors of the tiles in the LEGO World Map set, indexed by the number
+# the set's instructions give each tile. Index 0 is left for pixels that have
+# no tile yet, which are rendered in black.
+EMPTY = 0
+WHITE = 1
+NAVY = 2
+PALETTE: List[Color] = [
+    (0, 0, 0),
+    (255, 255, 255),
+    (0, 53, 91),
+    (19, 183, 210),
+    (0, 153, 150),
+    (0, 161, 55),
+    (162, 197, 16),
+    (226, 202, 144),
+    (248, 172, 0),
+    (238, 117, 0),
+    (237, 106, 112)
+]
+TILE_NAMES: List[str] = [
+    '00 - Empty',
+    '01 - White',
+    '02 - Navy',
+    '03 - Cyan',
+    '04 - Teal',
+    '05 - Green',
+    '06 - Olive',
+    '07 - Beige',
+    '08 - Yellow',
+    '09 - Orange',
+    '10 - Coral'
+]
+
+PALETTE_RGB = array(PALETTE, dtype=uint8)
+
+# The radius of each tile, in pixels of the image.
+STUD_RADIUS = 0.475
+
+
+def pack_colors(rgb: ndarray) -> ndarray:
+    """
+    Packs RGB values, along the last axis, into one integer per color.
+    """
+    rgb = rgb.astype(int64)
+    return rgb[..., 0] << 16 | rgb[..., 1] << 8 | rgb[..., 2]
+
+
+def parse_tile(tile: str) -> int:
+    """
+    Returns the palette index of a tile written as 'r,g,b', which is how the
+    CSVs refer to tiles.
+    """
+    color = tuple(int(x) for x in tile.split(','))
+    if color not in PALETTE:
+        raise Exception('%s is not the color of a tile' % tile)
+    return PALETTE.index(color)
+
+
+def get_tile_key(index: int) -> str:
+    """
+    Returns a tile as 'r,g,b', which is how the CSVs refer to tiles.
+    """
+    return '%d,%d,%d' % PALETTE[index]
+
+
+def rgb_to_palette(rgb: ndarray) -> ndarray:
+    """
+    Converts an RGB image into an array of palette indices.
+    """
+    colors, inverse = unique(pack_colors(rgb).reshape(-1), return_inverse=True)
+    packed_palette = pack_colors(PALETTE_RGB).tolist()
+    color_indices = full(colors.shape, 0, dtype=uint8)
+    for i, color in enumerate(colors.tolist()):
+        if color not in packed_palette:
+            raise Exception(
+                'Color (%d, %d, %d) is not the color of a tile' %
+                (color >> 16 & 255, color >> 8 & 255, color & 255)
+            )
+        color_indices[i] = packed_palette.index(color)
+    return color_indices[inverse].reshape(rgb.shape[:-1])
+
+
+def palette_to_rgb(indices: ndarray) -> ndarray:
+    return PALETTE_RGB[indices]
+
+
+def read_palette_image(image: Union[Path, ndarray]) -> ndarray:
+    """
+    Returns the palette indices of an image, reading it from disk unless it
+    has already been loaded into an array of palette indices.
+    """
+    if isinstance(image, ndarray):
+        return image
+    with Image.open(image.as_posix()) as pil_image:
+        if pil_image.mode == 'P' and \
+                pil_image.getpalette()[:PALETTE_RGB.size] == \
+                PALETTE_RGB.reshape(-1).tolist():
+            return asarray(pil_image)
+        return rgb_to_palette(asarray(pil_image.convert('RGB')))
+
+
+def save_palette_image(indices: ndarray, path: Path):
+    """
+    Saves palette indices as a palette-based PNG, which stores one byte per
+    pixel.
+    """
+    image = Image.fromarray(indices.astype(uint8), mode='P')
+    image.putpalette(PALETTE_RGB.reshape(-1).tolist())
+    image.save(path.as_posix())
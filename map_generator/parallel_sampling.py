@@ -0,0 +1,235 @@
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+from typing import Callable, List, Optional, Tuple
+
+from numpy import ndarray, array, concatenate, count_nonzero, cumsum, \
+    linspace, nonzero, searchsorted, unique, int16
+
+from bathymetry_pyramid import BathymetryPyramid, retrieve_bathymetry_pyramid
+from bathymetry_sampler import retrieve_bathymetry_sampler
+
+# Projects the x and y of pixels on the canvas to the longitude, latitude and
+# resolution in degrees of the centers of the pixels. It is sent to the
+# worker processes, so it must be picklable, such as a `functools.partial` of
+# a module-level function.
+PixelProjection = Callable[
+    [ndarray, ndarray],
+    Tuple[ndarray, ndarray, ndarray]
+]
+
+# For each level a band of rows was sampled from: the level, the longitude
+# and latitude of the band's first coordinate in the level, and the tiles
+# that the first and last coordinates in the level were read from.
+BandSummary = List[Tuple[int, float, float, int, int]]
+
+# Each worker is given several bands, so that a worker that finishes its
+# bands early can take over bands from the others.
+BANDS_PER_WORKER = 4
+
+
+def retrieve_depth_pyramid(sampling: str, statistic: str) -> BathymetryPyramid:
+    """
+    Returns the pyramid to sample from. Sampling the nearest depth is the
+    same as sampling a pyramid that only has the full resolution level.
+    """
+    if sampling == 'area':
+        return retrieve_bathymetry_pyramid(statistic)
+    return BathymetryPyramid([retrieve_bathymetry_sampler()])
+
+
+def split_rows(row_offsets: ndarray, band_count: int) -> List[Tuple[int, int]]:
+    """
+    Splits the rows into bands of roughly the same number of pixels, given
+    the offset of each row's first pixel and the total number of pixels.
+    """
+    targets = linspace(0, row_offsets[-1], band_count + 1)[1:-1]
+    boundaries = unique(concatenate([
+        [0],
+        searchsorted(row_offsets, targets),
+        [row_offsets.size - 1]
+    ]))
+    return list(zip(boundaries[:-1].tolist(), boundaries[1:].tolist()))
+
+
+def sample_rows(
+        project: PixelProjection,
+        mask: ndarray,
+        row_start: int,
+        value_offset: int,
+        sampling: str,
+        statistic: str,
+        shared_memory_name: str,
+        previous_tile_indices: Optional[List[int]] = None
+) -> BandSummary:
+    """
+    Samples the depth of the pixels that are true in a band of rows of the
+    mask, starting at the given row of the canvas, and writes the depths to
+    the shared memory from the value offset onwards. The bathymetry data is
+    opened once by each worker process.
+    """
+    output_y, output_x = nonzero(mask)
+    output_y += row_start
+    longitudes, latitudes, resolutions = project(output_x, output_y)
+    values, level_indices, tile_indices = \
+        retrieve_depth_pyramid(sampling, statistic).sample_with_tile_indices(
+            longitudes,
+            latitudes,
+            resolutions,
+            previous_tile_indices
+        )
+
+    shared_memory = SharedMemory(name=shared_memory_name)
+    shared_values = ndarray(
+        (value_offset + values.size,),
+        dtype=int16,
+        buffer=shared_memory.buf
+    )
+    shared_values[value_offset:] = values
+    del shared_values
+    shared_memory.close()
+
+    summary = []
+    for level in unique(level_indices).tolist():
+        indices = nonzero(level_indices == level)[0]
+        first = indices[0]
+        summary.append((
+            level,
+            float(longitudes[first]),
+            float(latitudes[first]),
+            int(tile_indices[first]),
+            int(tile_indices[indices[-1]])
+        ))
+    return summary
+
+
+def get_last_tile_indices(
+        level_indices: ndarray,
+        tile_indices: ndarray,
+        previous_tile_indices: List[int]
+) -> List[int]:
+    """
+    Returns, for each level, the tile that the last coordinate in the level
+    was read from, or the previous tile if none were.
+    """
+    last_tile_indices = list(previous_tile_indices)
+    for level in unique(level_indices).tolist():
+        last_tile_indices[level] = \
+            int(tile_indices[nonzero(level_indices == level)[0][-1]])
+    return last_tile_indices
+
+
+def sample_pixels(
+        project: PixelProjection,
+        mask: ndarray,
+        sampling: str = 'nearest',
+        statistic: str = 'mean',
+        workers: int = 1
+) -> ndarray:
+    """
+    Returns the depth, in meters, of every pixel that is true in the mask, in
+    the order of `nonzero(mask)`.
+    """
+    return sample_pixel_band(project, mask, 0, sampling, statistic, workers)[0]
+
+
+def sample_pixel_band(
+        project: PixelProjection,
+        mask: ndarray,
+        row_start: int = 0,
+        sampling: str = 'nearest',
+        statistic: str = 'mean',
+        workers: int = 1,
+        previous_tile_indices: Optional[List[int]] = None
+) -> Tuple[ndarray, List[int]]:
+    """
+    Returns the depth, in meters, of every pixel that is true in a band of
+    rows of the mask, starting at the given row of the canvas. Also returns
+    the tiles that the band was last read from in each level, so that the
+    next band can be sampled as if the rows were sampled in one go.
+
+    With more than one worker, the band is split into smaller bands of rows
+    that are projected and sampled in separate processes. Which tile a
+    coordinate along the edge of two tiles is read from depends on the
+    coordinate before it, so bands whose first coordinate would have been
+    read from a different tile, had the rows been sampled in one go, are
+    sampled again once the band before them is known. This keeps the output
+    the same no matter the number of workers.
+    """
+    pyramid = retrieve_depth_pyramid(sampling, statistic)
+    if previous_tile_indices is None:
+        previous_tile_indices = [-1] * len(pyramid.levels)
+
+    if workers == 1:
+        output_y, output_x = nonzero(mask)
+        longitudes, latitudes, resolutions = \
+            project(output_x, output_y + row_start)
+        values, level_indices, tile_indices = \
+            pyramid.sample_with_tile_indices(
+                longitudes,
+                latitudes,
+                resolutions,
+                previous_tile_indices
+            )
+        return values, get_last_tile_indices(
+            level_indices,
+            tile_indices,
+            previous_tile_indices
+        )
+
+    row_offsets = concatenate([[0], cumsum(count_nonzero(mask, axis=1))])
+    bands = split_rows(row_offsets, workers * BANDS_PER_WORKER)
+    value_count = int(row_offsets[-1])
+
+    shared_memory = SharedMemory(create=True, size=max(1, value_count * 2))
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(
+                    sample_rows,
+                    project,
+                    mask[start:end],
+                    row_start + start,
+                    int(row_offsets[start]),
+                    sampling,
+                    statistic,
+                    shared_memory.name
+                )
+                for start, end in bands
+            ]
+            summaries = [future.result() for future in futures]
+
+        # Stitch the bands together in order, resampling a band if its
+        # first coordinate in a level would have been read from the tile
+        # that the band before it ended on.
+        previous_tile_indices = list(previous_tile_indices)
+        for band, summary in zip(bands, summaries):
+            for level, longitude, latitude, first_tile, _ in summary:
+                tile_indices, _, _ = pyramid.levels[level].lookup_tile_indices(
+                    array([longitude]),
+                    array([latitude]),
+                    previous_tile_indices[level]
+                )
+                if tile_indices[0] != first_tile:
+                    summary = sample_rows(
+                        project,
+                        mask[band[0]:band[1]],
+                        row_start + band[0],
+                        int(row_offsets[band[0]]),
+                        sampling,
+                        statistic,
+                        shared_memory.name,
+                        previous_tile_indices
+                    )
+                    break
+            for level, _, _, _, last_tile in summary:
+                previous_tile_indices[level] = last_tile
+
+        values = ndarray(
+            (value_count,),
+            dtype=int16,
+            buffer=shared_memory.buf
+        ).copy()
+    finally:
+        shared_memory.close()
+        shared_memory.unlink()
+    return values, previous_tile_indices
@@ -0,0 +1,482 @@
+import json
+import sys
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, TypedDict, Union
+
+import click
+from PIL import Image
+from map_engraver.canvas import Canvas
+from numpy import ndarray, frombuffer, where, uint8
+from numpy.random import default_rng
+
+import bathymetry_pyramid
+import bathymetry_sampler
+import bathymetry_tile
+import brightness_tile_proportions
+import coastline_store
+import gebco_raster_store
+import lego_projection_transformer_builder
+import palette
+import parallel_sampling
+import step_1_land_grayscale_utm_map
+import step_1_land_grayscale_world_map
+import step_2_grayscale_to_1bit
+import step_3_land_shadow
+import step_4_sea_grayscale_utm_map
+import step_4_sea_grayscale_world_map
+import step_5_sea
+import tile_bounds_index
+import utm_projection_transformer_builder
+from palette import EMPTY, WHITE, save_palette_image
+from step_2_grayscale_to_1bit import FILTERS, save_1bit_image
+from step_3_land_shadow import add_land_shadow
+from step_5_sea import distribute_sea_tiles
+from step_6_pixels_to_lego import render_lego
+from step_cache import StepCache, hash_key, hash_parameters, hash_files, \
+    hash_modules, hash_file_stats
+
+PROJECTIONS = ['utm', 'world']
+NATURAL_EARTH_DATA_PATHS = {
+    'utm': ['ne_10m_land', 'ne_10m_lakes'],
+    'world': ['ne_110m_land', 'ne_110m_lakes']
+}
+BATHYMETRY_DATA_PATHS = [
+    Path('data/gebco_2021_sub_ice_topo_geotiff'),
+    Path('data/gebco_2021_sub_ice_topo_raster'),
+    Path('data/gebco_2021_sub_ice_topo_pyramid')
+]
+
+
+class RegionConfig(TypedDict, total=False):
+    """
+    The options of every step for a region, as read from a JSON file. The
+    size, center, scale, rotation and max_depth are only needed by the UTM
+    projection.
+    """
+    name: str
+    projection: str
+    size: List[int]
+    center: List[float]
+    scale: float
+    rotation: float
+    max_depth: int
+    mode: str
+    shadow_directions: List[str]
+    shadow_width: int
+    sampling: str
+    statistic: str
+    brightness_tile_proportions: str
+    max_tile_counts: str
+    allocation: str
+    seed: Optional[int]
+
+
+REGION_CONFIG_DEFAULTS: RegionConfig = {
+    'projection': 'utm',
+    'rotation': 0,
+    'max_depth': 10511,
+    'mode': 'custom_1',
+    'shadow_directions': ['east'],
+    'shadow_width': 1,
+    'sampling': 'nearest',
+    'statistic': 'mean',
+    'allocation': 'sample',
+    'seed': None
+}
+
+
+def read_region_config(config_path: Path) -> RegionConfig:
+    """
+    Reads a region's config, filling in the defaults for any missing options.
+    The name of the region defaults to the name of the file.
+    """
+    with open(config_path.as_posix()) as file:
+        config = json.load(file)
+    return complete_region_config(config, config_path.stem)
+
+
+def complete_region_config(config: dict, default_name: str) -> RegionConfig:
+    config = {**REGION_CONFIG_DEFAULTS, 'name': default_name, **config}
+
+    if config['projection'] not in PROJECTIONS:
+        raise Exception(
+            'Unknown projection %s for region %s' %
+            (config['projection'], config['name'])
+        )
+    required = ['brightness_tile_proportions', 'max_tile_counts']
+    if config['projection'] == 'utm':
+        required += ['size', 'center', 'scale']
+    for key in required:
+        if key not in config:
+            raise Exception(
+                'Missing %s in the config of region %s' %
+                (key, config['name'])
+            )
+    if config['mode'] not in FILTERS:
+        raise Exception(
+            'Unknown mode %s for region %s' % (config['mode'], config['name'])
+        )
+    return config
+
+
+def convert_land_to_1bit(land: ndarray, mode: str) -> ndarray:
+    """
+    Returns step 2's output, the same as the step 2 script saves it.
+    """
+    return step_2_grayscale_to_1bit.convert_to_1bit(FILTERS[mode](land))
+
+
+def add_shadow_to_land(
+        land: ndarray,
+        directions: List[str],
+        width: int
+) -> ndarray:
+    """
+    Returns step 3's output for step 2's output, the same as the step 3
+    script saves it.
+    """
+    return add_land_shadow(
+        where(land == 255, WHITE, EMPTY).astype(uint8),
+        directions,
+        width
+    )
+
+
+def read_canvas_brightness(canvas: Canvas) -> ndarray:
+    """
+    Returns the red channel of a canvas that is drawn in shades of gray, read
+    straight from its cairo image surface.
+    """
+    surface = canvas.surface
+    surface.flush()
+    height = surface.get_height()
+    width = surface.get_width()
+    pixels = frombuffer(surface.get_data(), dtype=uint8)\
+        .reshape(height, surface.get_stride())[:, :width * 4]\
+        .reshape(height, width, 4)
+    # Cairo stores each pixel as a native-endian 32-bit ARGB integer.
+    red_channel = 2 if sys.byteorder == 'little' else 1
+    return pixels[:, :, red_channel].copy()
+
+
+def get_step_path(output_dir: Path, name: str, step: int) -> Path:
+    return output_dir.joinpath('%s_step_%d.png' % (name, step))
+
+
+def get_step_keys(
+        config: RegionConfig,
+        seed: Optional[Union[int, List[int]]]
+) -> Dict[int, Optional[str]]:
+    """
+    Returns the cache key of each step's output, hashed from the step's
+    options, the source code of the modules it runs, the data it reads and
+    the keys of the steps it takes its input from. Step 5 only has a key if
+    it is seeded.
+    """
+    pipeline_module = sys.modules[__name__]
+    utm = config['projection'] == 'utm'
+    if utm:
+        projection_modules = [
+            step_1_land_grayscale_utm_map,
+            step_4_sea_grayscale_utm_map,
+            utm_projection_transformer_builder
+        ]
+        projection_parameters = {
+            key: config[key]
+            for key in ['size', 'center', 'scale', 'rotation']
+        }
+    else:
+        projection_modules = [
+            step_1_land_grayscale_world_map,
+            step_4_sea_grayscale_world_map,
+            lego_projection_transformer_builder
+        ]
+        projection_parameters = {}
+    natural_earth_data_path = Path(step_1_land_grayscale_utm_map.__file__)\
+        .parent.parent.joinpath('data')
+
+    keys = {}
+    keys[1] = hash_key(
+        'step_1',
+        hash_parameters(projection_parameters),
+        hash_modules([pipeline_module, coastline_store] + projection_modules),
+        hash_file_stats([
+            natural_earth_data_path.joinpath(path)
+            for path in NATURAL_EARTH_DATA_PATHS[config['projection']]
+        ])
+    )
+    keys[2] = hash_key(
+        'step_2',
+        hash_parameters({'mode': config['mode']}),
+        hash_modules([pipeline_module, step_2_grayscale_to_1bit]),
+        keys[1]
+    )
+    keys[3] = hash_key(
+        'step_3',
+        hash_parameters({
+            'shadow_directions': config['shadow_directions'],
+            'shadow_width': config['shadow_width']
+        }),
+        hash_modules([pipeline_module, step_3_land_shadow, palette]),
+        keys[2]
+    )
+    keys[4] = hash_key(
+        'step_4',
+        hash_parameters({
+            **projection_parameters,
+            'max_depth': config['max_depth'] if utm else None,
+            'sampling': config['sampling'],
+            'statistic': config['statistic']
+        }),
+        hash_modules([
+            pipeline_module,
+            bathymetry_pyramid,
+            bathymetry_sampler,
+            bathymetry_tile,
+            gebco_raster_store,
+            parallel_sampling,
+            tile_bounds_index
+        ] + projection_modules),
+        hash_file_stats(BATHYMETRY_DATA_PATHS),
+        keys[3]
+    )
+    keys[5] = None
+    if seed is not None:
+        keys[5] = hash_key(
+            'step_5',
+            hash_parameters({
+                'allocation': config['allocation'],
+                'seed': seed
+            }),
+            hash_modules([
+                pipeline_module,
+                step_5_sea,
+                brightness_tile_proportions,
+                palette
+            ]),
+            hash_files([
+                Path(config['brightness_tile_proportions']),
+                Path(config['max_tile_counts'])
+            ]),
+            keys[3],
+            keys[4]
+        )
+    return keys
+
+
+def run_pipeline(
+        config: RegionConfig,
+        output_dir: Path,
+        intermediates: bool = False,
+        lego: bool = False,
+        seed: Optional[Union[int, List[int]]] = None,
+        cache: Optional[StepCache] = None,
+        workers: int = 1
+) -> ndarray:
+    """
+    Runs steps 1 to 5 for a region in one process, passing the images between
+    the steps as arrays. Only step 5's image is saved, unless the
+    intermediate images are asked for, or step 6 is also run.
+
+    Given a cache, any step whose output is already cached is skipped, and
+    steps are only run when their output is needed. The sea depth is sampled
+    with the given number of worker processes.
+
+    Returns the palette indices of step 5's image.
+    """
+    if seed is None:
+        seed = config['seed']
+    name = config['name']
+    utm = config['projection'] == 'utm'
+    keys = get_step_keys(config, seed) if cache is not None else {}
+    outputs = {}
+
+    def get_output(step: int) -> ndarray:
+        if step in outputs:
+            return outputs[step]
+        key = keys.get(step)
+        if key is not None:
+            outputs[step] = cache.get(key)
+            if outputs[step] is not None:
+                print('Using the cached step %d of %s' % (step, name))
+                return outputs[step]
+        outputs[step] = steps[step]()
+        if key is not None:
+            cache.put(key, outputs[step])
+        return outputs[step]
+
+    # Step 1: Render the land. The canvas is never closed, so it is not
+    # written to disk.
+    def render_land() -> ndarray:
+        canvas_path = get_step_path(output_dir, name, 1)
+        if utm:
+            canvas = step_1_land_grayscale_utm_map.build_land_canvas(
+                canvas_path,
+                (config['size'][0], config['size'][1]),
+                (config['center'][0], config['center'][1]),
+                float(config['scale']),
+                float(config['rotation'])
+            )
+        else:
+            canvas = step_1_land_grayscale_world_map.build_land_canvas(
+                canvas_path
+            )
+        return read_canvas_brightness(canvas)
+
+    # Step 2: Convert the land to black and white.
+    def convert_to_1bit() -> ndarray:
+        return convert_land_to_1bit(get_output(1), config['mode'])
+
+    # Step 3: Add the shadow.
+    def add_shadow() -> ndarray:
+        return add_shadow_to_land(
+            get_output(2),
+            config['shadow_directions'],
+            config['shadow_width']
+        )
+
+    # Step 4: Render the sea depth.
+    def sample_sea_depth() -> ndarray:
+        if utm:
+            return step_4_sea_grayscale_utm_map.sample_sea_depth(
+                get_output(3) == EMPTY,
+                (config['size'][0], config['size'][1]),
+                (config['center'][0], config['center'][1]),
+                float(config['scale']),
+                float(config['rotation']),
+                int(config['max_depth']),
+                config['sampling'],
+                config['statistic'],
+                workers
+            )
+        return step_4_sea_grayscale_world_map.sample_sea_depth(
+            get_output(3) == EMPTY,
+            1,
+            config['sampling'],
+            config['statistic'],
+            workers
+        )
+
+    # Step 5: Distribute the tiles over the sea.
+    def distribute_tiles() -> ndarray:
+        palette_indices, _ = distribute_sea_tiles(
+            get_output(3),
+            get_output(4),
+            Path(config['brightness_tile_proportions']),
+            Path(config['max_tile_counts']),
+            config['allocation'],
+            default_rng(seed)
+        )
+        return palette_indices
+
+    steps: Dict[int, Callable[[], ndarray]] = {
+        1: render_land,
+        2: convert_to_1bit,
+        3: add_shadow,
+        4: sample_sea_depth,
+        5: distribute_tiles
+    }
+
+    tiles = get_output(5)
+    save_palette_image(tiles, get_step_path(output_dir, name, 5))
+
+    if intermediates:
+        Image \
+            .fromarray(get_output(1), mode='L') \
+            .convert('RGB') \
+            .save(get_step_path(output_dir, name, 1).as_posix())
+        save_1bit_image(get_output(2), get_step_path(output_dir, name, 2))
+        save_palette_image(get_output(3), get_step_path(output_dir, name, 3))
+        Image \
+            .fromarray(get_output(4), mode='L') \
+            .save(get_step_path(output_dir, name, 4).as_posix())
+
+    # Step 6: Render the tiles as LEGO.
+    if lego:
+        render_lego(tiles, get_step_path(output_dir, name, 6))
+
+    return tiles
+
+
+@click.command()
+@click.argument(
+    'region_config',
+    nargs=1,
+    type=click.Path(exists=True)
+)
+@click.argument(
+    'output_dir',
+    nargs=1,
+    type=click.Path(file_okay=False)
+)
+@click.option(
+    "--intermediates/--no-intermediates",
+    default=False,
+    help='Also saves the images of steps 1 to 4, for debugging.'
+)
+@click.option(
+    "--lego/--no-lego",
+    default=False,
+    help='Also runs step 6, rendering the tiles as LEGO.'
+)
+@click.option(
+    "--seed",
+    default=None,
+    type=click.INT,
+    help='Seeds the random placement of tiles, overriding the seed in the '
+         'region config.'
+)
+@click.option(
+    "--cache-dir",
+    default=None,
+    type=click.Path(file_okay=False),
+    help='A directory to cache the output of each step in, so that steps '
+         'whose options and inputs have not changed are skipped.'
+)
+@click.option(
+    "--cache-size",
+    default=1024,
+    type=click.IntRange(min=0),
+    help='The most megabytes to keep in the cache.'
+)
+@click.option(
+    "--workers",
+    default=1,
+    type=click.IntRange(min=1),
+    help='The number of processes to sample the sea depth with.'
+)
+def run(
+        region_config: str,
+        output_dir: str,
+        intermediates: bool,
+        lego: bool,
+        seed: Optional[int],
+        cache_dir: Optional[str],
+        cache_size: int,
+        workers: int
+):
+    """
+    Runs every step for the region described by the JSON REGION_CONFIG,
+    saving the images to OUTPUT_DIR as <name>_step_<step>.png.
+    """
+    config = read_region_config(Path(region_config))
+    if seed is not None:
+        config['seed'] = seed
+
+    output_path = Path(output_dir)
+    output_path.mkdir(parents=True, exist_ok=True)
+    cache = None
+    if cache_dir is not None:
+        cache = StepCache(Path(cache_dir), cache_size * 1024 * 1024)
+    run_pipeline(
+        config,
+        output_path,
+        intermediates,
+        lego,
+        cache=cache,
+        workers=workers
+    )
+
+
+if __name__ == '__main__':
+    run()
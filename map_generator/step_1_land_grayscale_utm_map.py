@@ -3,16 +3,16 @@ from typing import List, Tuple
 
 import cairocffi
 import click
-import shapefile
-from map_engraver.canvas import CanvasBuilder
+from map_engraver.canvas import Canvas, CanvasBuilder
 
 from map_engraver.canvas.canvas_unit import CanvasUnit
 from map_engraver.drawable.geometry.polygon_drawer import PolygonDrawer
 from map_engraver.drawable.layout.background import Background
 from shapely import ops
-from shapely.geometry import shape, Polygon
+from shapely.geometry import Polygon
 from shapely.geometry.base import BaseGeometry
 
+from coastline_store import parse_shapefile
 from utm_projection_transformer_builder import \
     UtmProjectionTransformerBuilder
 
@@ -58,56 +58,23 @@ def parse_center(center: str) -> Tuple[float, float]:
     return longitude, latitude
 
 
-@click.command()
-@click.argument(
-    'dst',
-    nargs=1,
-    type=click.Path(exists=False)
-)
-@click.option(
-    "--aliased/--anti-aliased",
-    default=False,
-    help='Disables anti-aliasing when rendering the image.'
-)
-@click.option(
-    "--size",
-    help='The width,height of the map in pixels.'
-)
-@click.option(
-    "--center",
-    help='The map latitude,longitude of the center position.'
-)
-@click.option(
-    "--scale",
-    help='The map scale, where a meter.'
-)
-@click.option(
-    "--rotation",
-    help='The rotation around the center of the map in degrees.'
-)
-@click.option(
-    "--pixel-scale-factor",
-    default=1,
-    help='Controls the size of the image.'
-)
-def render(
-        dst: str,
-        aliased: bool,
-        size: str,
-        center: str,
-        scale: str,
-        rotation: str,
-        pixel_scale_factor: int
-):
-    # Specify the files to load, and where to save
+def build_land_canvas(
+        canvas_path: Path,
+        canvas_size_in_pixels: Tuple[int, int],
+        center_coordinate: Tuple[float, float],
+        scale: float,
+        rotation: float,
+        aliased: bool = False,
+        pixel_scale_factor: int = 1
+) -> Canvas:
+    """
+    Draws the land onto a canvas, which is returned without being closed, so
+    that it is only written to the canvas path once `close()` is called.
+    """
+    # Specify the files to load
     data_path = Path(__file__).parent.parent.joinpath('data')
     land_shape_path = data_path.joinpath('ne_10m_land/ne_10m_land.shp')
     lake_shape_path = data_path.joinpath('ne_10m_lakes/ne_10m_lakes.shp')
-    canvas_path = Path(dst)
-    canvas_path.unlink(missing_ok=True)
-
-    canvas_size_in_pixels = parse_size(size)
-    center_coordinate = parse_center(center)
 
     # Create the canvas
     canvas_builder = CanvasBuilder()
@@ -121,24 +88,13 @@ def render(
     if aliased:
         canvas.context.set_antialias(cairocffi.ANTIALIAS_NONE)
 
-    # Read world map shapefile
-    def parse_shapefile(shapefile_path: Path):
-        shapefile_collection = shapefile.Reader(shapefile_path.as_posix())
-        shapely_objects = []
-        for shape_record in shapefile_collection.shapeRecords():
-            shapely_objects.append(shape(shape_record.shape.__geo_interface__))
-        return shapely_objects
-
-    land_shapes = parse_shapefile(land_shape_path)
-    lake_shapes = parse_shapefile(lake_shape_path)
-
     utm_projection_transformer_builder = UtmProjectionTransformerBuilder(
         canvas_width,
         canvas_height,
         center_coordinate[0],
         center_coordinate[1],
-        float(scale),
-        float(rotation)
+        scale,
+        rotation
     )
 
     # We need to cull polygons outside of the bbox, which this thing achieves
@@ -151,11 +107,15 @@ def render(
         [bbox[0], bbox[1]],
     ])
 
+    # Only read the shapes that might be within the bbox.
+    land_shapes = parse_shapefile(land_shape_path, bbox)
+    lake_shapes = parse_shapefile(lake_shape_path, bbox)
+
     def cull_geom(geom: BaseGeometry):
         return geom.intersection(wgs84_bbox_polygon)
 
     wgs84_to_utm_canvas_transformer = utm_projection_transformer_builder\
-        .build_wgs84_to_utm_on_canvas()
+        .build_wgs84_to_utm_on_canvas_vectorized()
 
     # Transform array of polygons to canvas:
     def transform_geom_to_canvas(geom: BaseGeometry):
@@ -189,6 +149,62 @@ def render(
     polygon_drawer.geoms = lake_shapes
     polygon_drawer.draw(canvas)
 
+    return canvas
+
+
+@click.command()
+@click.argument(
+    'dst',
+    nargs=1,
+    type=click.Path(exists=False)
+)
+@click.option(
+    "--aliased/--anti-aliased",
+    default=False,
+    help='Disables anti-aliasing when rendering the image.'
+)
+@click.option(
+    "--size",
+    help='The width,height of the map in pixels.'
+)
+@click.option(
+    "--center",
+    help='The map latitude,longitude of the center position.'
+)
+@click.option(
+    "--scale",
+    help='The map scale, where a meter.'
+)
+@click.option(
+    "--rotation",
+    help='The rotation around the center of the map in degrees.'
+)
+@click.option(
+    "--pixel-scale-factor",
+    default=1,
+    help='Controls the size of the image.'
+)
+def render(
+        dst: str,
+        aliased: bool,
+        size: str,
+        center: str,
+        scale: str,
+        rotation: str,
+        pixel_scale_factor: int
+):
+    canvas_path = Path(dst)
+    canvas_path.unlink(missing_ok=True)
+
+    canvas = build_land_canvas(
+        canvas_path,
+        parse_size(size),
+        parse_center(center),
+        float(scale),
+        float(rotation),
+        aliased,
+        pixel_scale_factor
+    )
     canvas.close()
 
 
@@ -3,43 +3,32 @@ from typing import List, Tuple
 
 import cairocffi
 import click
-import shapefile
-from map_engraver.canvas import CanvasBuilder
+from map_engraver.canvas import Canvas, CanvasBuilder
 
 from map_engraver.canvas.canvas_unit import CanvasUnit
 from map_engraver.drawable.geometry.polygon_drawer import PolygonDrawer
 from map_engraver.drawable.layout.background import Background
 from shapely import ops
-from shapely.geometry import shape
 from shapely.geometry.base import BaseGeometry
 
+from coastline_store import parse_shapefile
 from lego_projection_transformer_builder import \
     LegoProjectionTransformerBuilder
 
 
-@click.command()
-@click.argument(
-    'dst',
-    nargs=1,
-    type=click.Path(exists=False)
-)
-@click.option(
-    "--aliased/--anti-aliased",
-    default=False,
-    help='Disables anti-aliasing when rendering the image.'
-)
-@click.option(
-    "--pixel-scale-factor",
-    default=1,
-    help='Controls the size of the image'
-)
-def render(dst: str, aliased: bool, pixel_scale_factor: int):
-    # Specify the files to load, and where to save
+def build_land_canvas(
+        canvas_path: Path,
+        aliased: bool = False,
+        pixel_scale_factor: int = 1
+) -> Canvas:
+    """
+    Draws the land onto a canvas, which is returned without being closed, so
+    that it is only written to the canvas path once `close()` is called.
+    """
+    # Specify the files to load
     data_path = Path(__file__).parent.parent.joinpath('data')
     land_shape_path = data_path.joinpath('ne_110m_land/ne_110m_land.shp')
     lake_shape_path = data_path.joinpath('ne_110m_lakes/ne_110m_lakes.shp')
-    canvas_path = Path(dst)
-    canvas_path.unlink(missing_ok=True)
 
     # Create the canvas
     canvas_builder = CanvasBuilder()
@@ -54,13 +43,6 @@ def render(dst: str, aliased: bool, pixel_scale_factor: int):
         canvas.context.set_antialias(cairocffi.ANTIALIAS_NONE)
 
     # Read world map shapefile
-    def parse_shapefile(shapefile_path: Path):
-        shapefile_collection = shapefile.Reader(shapefile_path.as_posix())
-        shapely_objects = []
-        for shape_record in shapefile_collection.shapeRecords():
-            shapely_objects.append(shape(shape_record.shape.__geo_interface__))
-        return shapely_objects
-
     land_shapes = parse_shapefile(land_shape_path)
     lake_shapes = parse_shapefile(lake_shape_path)
 
@@ -70,7 +52,7 @@ def render(dst: str, aliased: bool, pixel_scale_factor: int):
     )
 
     wgs84_to_lego_transformer = lego_projection_transformer_builder.\
-        build_wgs84_to_lego()
+        build_wgs84_to_lego_vectorized()
 
     def anti_meridian_transformer(x: float, y: float) -> Tuple[float, float]:
         # See `lego_projection_transformer()`
@@ -114,6 +96,30 @@ def render(dst: str, aliased: bool, pixel_scale_factor: int):
     polygon_drawer.geoms = lake_shapes
     polygon_drawer.draw(canvas)
 
+    return canvas
+
+
+@click.command()
+@click.argument(
+    'dst',
+    nargs=1,
+    type=click.Path(exists=False)
+)
+@click.option(
+    "--aliased/--anti-aliased",
+    default=False,
+    help='Disables anti-aliasing when rendering the image.'
+)
+@click.option(
+    "--pixel-scale-factor",
+    default=1,
+    help='Controls the size of the image'
+)
+def render(dst: str, aliased: bool, pixel_scale_factor: int):
+    canvas_path = Path(dst)
+    canvas_path.unlink(missing_ok=True)
+
+    canvas = build_land_canvas(canvas_path, aliased, pixel_scale_factor)
     canvas.close()
 
 
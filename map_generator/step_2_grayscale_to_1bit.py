@@ -1,50 +1,148 @@
 from pathlib import Path
-from typing import List
+from typing import List, Tuple
 
 import click
 from PIL import Image
 
-# Load image
-from numpy import zeros, dtype, uint16
-from numpy import asarray, array
+from numpy import ndarray, asarray, zeros, roll, where, arange, block, \
+    uint8, uint16, int64, float64
+
+# Error diffusion kernels, as the divisor of the weights and the (y, x)
+# offset and weight of every neighbor the error is diffused to.
+FLOYD_STEINBERG_KERNEL = (16, [(0, 1, 7), (1, -1, 3), (1, 0, 5), (1, 1, 1)])
+ATKINSON_KERNEL = (
+    8,
+    [(0, 1, 1), (0, 2, 1), (1, -1, 1), (1, 0, 1), (1, 1, 1), (2, 0, 1)]
+)
 
 
-def get_neighbors(x: int, y: int, source) -> List[int]:
-    source_height, source_width = source.shape
-    n = []
-    for n_x_o in (-1, 0, 1):
-        for n_y_o in (-1, 0, 1):
+def get_neighbor_sums(source: ndarray) -> ndarray:
+    """
+    Returns the sum of the 8 neighbors of every pixel, wrapping around the
+    edges of the image.
+    """
+    source = source.astype(uint16)
+    n_sum = zeros(source.shape, dtype=uint16)
+    for n_y_o in (-1, 0, 1):
+        rows = roll(source, n_y_o, axis=0)
+        for n_x_o in (-1, 0, 1):
             if n_x_o == 0 and n_y_o == 0:
                 continue
-            n_y = (y + n_y_o) % source_height
-            n_x = (x + n_x_o) % source_width
-            n.append(source[n_y, n_x])
-    return n
+            n_sum += roll(rows, n_x_o, axis=1)
+    return n_sum
+
+
+# Filter functions
+def custom_kernel_filter(source: ndarray) -> ndarray:
+    c_val = source.astype(float64)
+    n_val = get_neighbor_sums(source) / 8.0
+    output = where(source > 125, 255, 0)
+    output[n_val < c_val * 0.85] = 255
+    output[n_val > c_val * 1.15] = 0
+    return output.astype(uint8)
+
+
+def dither_filter(source: ndarray) -> ndarray:
+    return source.copy()
+
+
+def threshold_filter(source: ndarray) -> ndarray:
+    return where(source > 128, 255, 0).astype(uint8)
+
+
+def error_diffusion_filter(
+        source: ndarray,
+        kernel: Tuple[int, List[Tuple[int, int, int]]]
+) -> ndarray:
+    """
+    Thresholds every pixel and diffuses the error to the neighbors given by
+    the kernel. Errors are rounded down to whole values before being
+    diffused, so the result does not depend on the order they are added in.
+
+    Pixels are visited in raster order, but since every neighbor in the
+    kernel lies after the pixel along x + 2y, each line of pixels with the
+    same x + 2y is independent and is thresholded in one go.
+    """
+    divisor, weights = kernel
+    height, width = source.shape
+    work = source.astype(int64)
+    output = zeros(source.shape, dtype=uint8)
+    for diagonal in range(width + 2 * (height - 1)):
+        ys = arange(
+            max(0, (diagonal - width + 2) // 2),
+            min(height - 1, diagonal // 2) + 1
+        )
+        xs = diagonal - 2 * ys
+        values = work[ys, xs]
+        quantized = where(values >= 128, 255, 0)
+        output[ys, xs] = quantized
+        error = values - quantized
+        for offset_y, offset_x, weight in weights:
+            target_ys = ys + offset_y
+            target_xs = xs + offset_x
+            valid = (
+                (target_ys < height) &
+                (target_xs >= 0) &
+                (target_xs < width)
+            )
+            work[target_ys[valid], target_xs[valid]] += \
+                error[valid] * weight // divisor
+    return output
+
+
+def floyd_steinberg_filter(source: ndarray) -> ndarray:
+    return error_diffusion_filter(source, FLOYD_STEINBERG_KERNEL)
+
+
+def atkinson_filter(source: ndarray) -> ndarray:
+    return error_diffusion_filter(source, ATKINSON_KERNEL)
+
+
+def get_bayer_matrix(size: int) -> ndarray:
+    """
+    Returns the size x size Bayer matrix, where size is a power of 2.
+    """
+    if size == 1:
+        return zeros((1, 1), dtype=int64)
+    matrix = get_bayer_matrix(size // 2) * 4
+    return block([[matrix, matrix + 2], [matrix + 3, matrix + 1]])
 
 
-# Filter function
-def custom_kernel_filter(x: int, y: int, source) -> int:
-    c_val = source[y, x]
-    neighbors = get_neighbors(x, y, source)
-    n_sum = sum(array(neighbors).astype(uint16))
-    n_val = n_sum / float(len(neighbors))
-    if n_val > c_val * 1.15:
-        return 0
-    elif n_val < c_val * 0.85:
-        return 255
-    if c_val > 125:
-        return 255
-    return 0
+def bayer_filter(source: ndarray) -> ndarray:
+    matrix = get_bayer_matrix(8)
+    thresholds = (matrix + 0.5) / matrix.size * 255
+    ys = arange(source.shape[0])[:, None] % matrix.shape[0]
+    xs = arange(source.shape[1])[None, :] % matrix.shape[1]
+    return where(source > thresholds[ys, xs], 255, 0).astype(uint8)
 
 
-def dither_filter(x: int, y: int, source) -> int:
-    return source[y, x]
+FILTERS = {
+    'threshold': threshold_filter,
+    'dither': dither_filter,
+    'custom_1': custom_kernel_filter,
+    'floyd_steinberg': floyd_steinberg_filter,
+    'atkinson': atkinson_filter,
+    'bayer': bayer_filter
+}
 
 
-def threshold_filter(x: int, y: int, source) -> int:
-    if source[y, x] > 128:
-        return 255
-    return 0
+def get_1bit_image(output_arr: ndarray) -> Image.Image:
+    # Numpy does not support 1-bit arrays, so we have to resort to first
+    # creating the image as a 8-bit image, then convert to 1-bit. Pillow
+    # dithers the image while converting it, which the dither mode relies on.
+    return Image.fromarray(output_arr, mode='L').convert('1')
+
+
+def convert_to_1bit(output_arr: ndarray) -> ndarray:
+    """
+    Returns the output of a filter as it is once saved as a 1-bit image,
+    with every pixel either 0 or 255.
+    """
+    return asarray(get_1bit_image(output_arr).convert('L'))
+
+
+def save_1bit_image(output_arr: ndarray, output_filepath: Path):
+    get_1bit_image(output_arr).save(output_filepath.as_posix())
 
 
 @click.command()
@@ -61,10 +159,7 @@ def threshold_filter(x: int, y: int, source) -> int:
 @click.option(
     "--mode",
     required=True,
-    type=click.Choice(
-        ['threshold', 'dither', 'custom_1'],
-        case_sensitive=False
-    ))
+    type=click.Choice(list(FILTERS.keys()), case_sensitive=False))
 def convert_grayscale_to_1bit(src: str, dst: str, mode: str):
     input_filepath = Path(src)
     output_filepath = Path(dst)
@@ -73,33 +168,13 @@ def convert_grayscale_to_1bit(src: str, dst: str, mode: str):
     input_rgb = asarray(Image.open(input_filepath.as_posix()))
     input_arr = input_rgb[:, :, 0]
 
-    # Apply filter for each pixel on the map
-    output_arr = zeros(shape=input_arr.shape, dtype=dtype('uint8'))
-
-    if mode == 'threshold':
-        filter_func = threshold_filter
-    elif mode == 'dither':
-        filter_func = dither_filter
-    elif mode == 'custom_1':
-        filter_func = custom_kernel_filter
-    else:
+    # Apply filter to every pixel on the map
+    if mode not in FILTERS:
         raise Exception('Please specify a mode')
-
-    for output_y in range(output_arr.shape[0]):
-        for output_x in range(output_arr.shape[1]):
-            output_arr[output_y][output_x] = filter_func(
-                output_x,
-                output_y,
-                input_arr
-            )
+    output_arr = FILTERS[mode](input_arr)
 
     # Output the image
-    # Numpy does not support 1-bit arrays, so we have to resort to first
-    # creating the image as a 8-bit image, then convert to 1-bit.
-    Image\
-        .fromarray(output_arr, mode='L')\
-        .convert('1')\
-        .save(output_filepath.as_posix())
+    save_1bit_image(output_arr, output_filepath)
 
 
 if __name__ == '__main__':
@@ -1,7 +1,58 @@
 from pathlib import Path
+from typing import List
 
 import click
-from PIL import Image
+from numpy import ndarray, zeros_like
+
+from palette import WHITE, NAVY, read_palette_image, save_palette_image
+
+# The (y, x) direction that each shadow is cast in.
+DIRECTIONS = {
+    'north': (-1, 0),
+    'east': (0, 1),
+    'south': (1, 0),
+    'west': (0, -1)
+}
+
+
+def shift(mask: ndarray, offset_y: int, offset_x: int) -> ndarray:
+    """
+    Shifts a 2D mask by the offset, filling the pixels shifted in from
+    outside the mask with False.
+    """
+    height, width = mask.shape
+    shifted = zeros_like(mask)
+    shifted[
+        max(0, offset_y):height + min(0, offset_y),
+        max(0, offset_x):width + min(0, offset_x)
+    ] = mask[
+        max(0, -offset_y):height + min(0, -offset_y),
+        max(0, -offset_x):width + min(0, -offset_x)
+    ]
+    return shifted
+
+
+def add_land_shadow(
+        image: ndarray,
+        directions: List[str],
+        width: int = 1,
+        shadow_tile: int = NAVY
+) -> ndarray:
+    """
+    Returns a copy of the image's palette indices, where the sea pixels
+    within the given width of land in any of the directions are given the
+    shadow's tile.
+    """
+    land = image == WHITE
+    shadow = zeros_like(land)
+    for direction in directions:
+        offset_y, offset_x = DIRECTIONS[direction]
+        for distance in range(1, width + 1):
+            shadow |= shift(land, offset_y * distance, offset_x * distance)
+
+    output = image.copy()
+    output[shadow & ~land] = shadow_tile
+    return output
 
 
 @click.command()
@@ -15,23 +66,27 @@ from PIL import Image
     nargs=1,
     type=click.Path(exists=False)
 )
-def render(src: str, dst: str):
+@click.option(
+    "--direction",
+    multiple=True,
+    default=['east'],
+    type=click.Choice(list(DIRECTIONS.keys()), case_sensitive=False),
+    help='The direction to cast the shadow in. Can be repeated.'
+)
+@click.option(
+    "--width",
+    default=1,
+    type=click.IntRange(min=1),
+    help='The width of the shadow in pixels.'
+)
+def render(src: str, dst: str, direction: List[str], width: int):
     input_filepath = Path(src)
     output_filepath = Path(dst)
-    shadow_color = (0, 53, 91)
-
-    image = Image.open(input_filepath.as_posix()).convert('RGB')
 
-    for y in range(image.height):
-        land_ahoy = False
-        for x in range(image.width):
-            if image.getpixel((x, y))[0] == 255:
-                land_ahoy = True
-            elif land_ahoy:
-                image.putpixel((x, y), shadow_color)
-                land_ahoy = False
+    image = read_palette_image(input_filepath)
+    output = add_land_shadow(image, direction, width)
 
-    image.save(output_filepath.as_posix())
+    save_palette_image(output, output_filepath)
 
 
 if __name__ == '__main__':
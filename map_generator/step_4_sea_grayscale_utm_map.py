@@ -1,23 +1,23 @@
-import math
-
-from geotiff.geotiff import BoundaryNotInTifError
-from typing import List, Tuple
+from functools import partial
+from typing import Optional, Tuple
 
 from PIL import Image
 from map_engraver.canvas.canvas_unit import CanvasUnit
-from numpy import zeros, dtype
+from numpy import ndarray, asarray, full, nonzero, zeros, minimum, maximum, \
+    floor, dtype
 from pathlib import Path
 
 import click
-from geotiff import GeoTiff
 
+from band_checkpoints import BandCheckpoints
+from bathymetry_pyramid import STATISTICS
+from image_bands import read_rgb_bands, write_grayscale_bands
+from parallel_sampling import sample_pixels, sample_pixel_band
+from step_cache import hash_file_stats
 from utm_projection_transformer_builder import \
     UtmProjectionTransformerBuilder
 
 
-Coord = Tuple[float, float]
-
-
 def parse_size(size: str) -> Tuple[int, int]:
     split_size = size.split(',')
 
@@ -59,45 +59,188 @@ def parse_center(center: str) -> Tuple[float, float]:
     return longitude, latitude
 
 
-def retrieve_geotiff_paths() -> List[Path]:
-    data_dir = Path('data/gebco_2021_sub_ice_topo_geotiff/')
-    geotiffs = [
-        'gebco_2021_sub_ice_topo_n0.0_s-90.0_w0.0_e90.0.tif',
-        'gebco_2021_sub_ice_topo_n0.0_s-90.0_w90.0_e180.0.tif',
-        'gebco_2021_sub_ice_topo_n0.0_s-90.0_w-90.0_e0.0.tif',
-        'gebco_2021_sub_ice_topo_n0.0_s-90.0_w-180.0_e-90.0.tif',
-        'gebco_2021_sub_ice_topo_n90.0_s0.0_w0.0_e90.0.tif',
-        'gebco_2021_sub_ice_topo_n90.0_s0.0_w90.0_e180.0.tif',
-        'gebco_2021_sub_ice_topo_n90.0_s0.0_w-90.0_e0.0.tif',
-        'gebco_2021_sub_ice_topo_n90.0_s0.0_w-180.0_e-90.0.tif'
-    ]
-    return list(map(lambda geotiff: data_dir.joinpath(geotiff), geotiffs))
-
-
-def retrieve_geotiffs() -> List[GeoTiff]:
-    return list(map(
-        lambda geotiff_path: GeoTiff(geotiff_path.as_posix()),
-        retrieve_geotiff_paths()
-    ))
-
-
-def is_coord_in_geotiff(coord: Coord, geotiff: GeoTiff) -> bool:
-    try:
-        return len(geotiff.get_int_box(
-            (coord, coord), outer_points=1
-        )) == 2
-    except BoundaryNotInTifError:
-        return False
-
-
-def lookup_coord_in_geotiffs(coord: Coord, geotiffs: List[GeoTiff]) -> GeoTiff:
-    for geotiff in geotiffs:
-        if is_coord_in_geotiff(coord, geotiff):
-            return geotiff
-    raise Exception(
-        'Failed to lookup geotiff for (%f, %f)' % (coord[0], coord[1])
+def project_pixels(
+        canvas_size_in_pixels: Tuple[int, int],
+        center_coordinate: Tuple[float, float],
+        scale: float,
+        rotation: float,
+        output_x: ndarray,
+        output_y: ndarray
+) -> Tuple[ndarray, ndarray, ndarray]:
+    """
+    Returns the WGS84 longitude, latitude and resolution of the center of
+    each pixel.
+    """
+    utm_projection_transformer_builder = UtmProjectionTransformerBuilder(
+        CanvasUnit.from_px(canvas_size_in_pixels[0]),
+        CanvasUnit.from_px(canvas_size_in_pixels[1]),
+        center_coordinate[0],
+        center_coordinate[1],
+        scale,
+        rotation
     )
 
+    utm_on_canvas_to_wgs84_transformer = utm_projection_transformer_builder. \
+        build_utm_on_canvas_to_wgs84_vectorized()
+
+    # We want the center of the WGS84 bbox, so add 0.5 to the x and y
+    longitudes, latitudes = utm_on_canvas_to_wgs84_transformer(
+        output_x + 0.5,
+        output_y + 0.5
+    )
+    resolutions = full(
+        longitudes.shape,
+        utm_projection_transformer_builder.get_wgs84_resolution()
+    )
+    return longitudes, latitudes, resolutions
+
+
+def get_sea_brightness(values: ndarray, max_depth: int) -> ndarray:
+    """
+    Returns the brightness of each depth, from white at sea level to black at
+    the max depth.
+    """
+    values = 255 - floor((minimum(0, values) / -max_depth) * 255)
+    return maximum(0, values)
+
+
+def sample_sea_depth(
+        sea_mask: ndarray,
+        canvas_size_in_pixels: Tuple[int, int],
+        center_coordinate: Tuple[float, float],
+        scale: float,
+        rotation: float,
+        max_depth: int,
+        sampling: str = 'nearest',
+        statistic: str = 'mean',
+        workers: int = 1
+) -> ndarray:
+    """
+    Returns the grayscale sea depth of every pixel on the canvas that is true
+    in the sea mask. Every other pixel is left white. The canvas is split
+    into bands of rows between the workers.
+    """
+    canvas_width = CanvasUnit.from_px(canvas_size_in_pixels[0])
+    canvas_height = CanvasUnit.from_px(canvas_size_in_pixels[1])
+    canvas_shape = (int(canvas_height.px), int(canvas_width.px))
+
+    # Skip pixels that will already be covered by the land + shadow map
+    output_arr = full(canvas_shape, 255, dtype=dtype('uint8'))
+    mask = sea_mask[:canvas_shape[0], :canvas_shape[1]]
+    output_y, output_x = nonzero(mask)
+
+    # For each position on the map, lookup the bathymetric value at that exact
+    # position and store in the output array.
+    values = sample_pixels(
+        partial(
+            project_pixels,
+            canvas_size_in_pixels,
+            center_coordinate,
+            scale,
+            rotation
+        ),
+        mask,
+        sampling,
+        statistic,
+        workers
+    )
+    output_arr[output_y, output_x] = get_sea_brightness(values, max_depth)
+
+    return output_arr
+
+
+def stream_sea_depth(
+        mask_path: Path,
+        output_path: Path,
+        canvas_size_in_pixels: Tuple[int, int],
+        center_coordinate: Tuple[float, float],
+        scale: float,
+        rotation: float,
+        max_depth: int,
+        sampling: str,
+        statistic: str,
+        workers: int,
+        band_height: int,
+        checkpoint_dir: Path
+):
+    """
+    Renders the same image as `sample_sea_depth`, but a band of rows at a
+    time, so that only a band of the mask and the output is held in memory.
+    Each band is checkpointed once it has been sampled, so that running the
+    same render again resumes from the last band it finished. The
+    checkpoints are removed once the image is saved.
+    """
+    canvas_width = int(CanvasUnit.from_px(canvas_size_in_pixels[0]).px)
+    canvas_height = int(CanvasUnit.from_px(canvas_size_in_pixels[1]).px)
+    band_count = -(-canvas_height // band_height)
+    project = partial(
+        project_pixels,
+        canvas_size_in_pixels,
+        center_coordinate,
+        scale,
+        rotation
+    )
+    checkpoints = BandCheckpoints(checkpoint_dir, {
+        'mask': hash_file_stats([mask_path]),
+        'size': list(canvas_size_in_pixels),
+        'center': list(center_coordinate),
+        'scale': scale,
+        'rotation': rotation,
+        'max_depth': max_depth,
+        'sampling': sampling,
+        'statistic': statistic,
+        'band_height': band_height
+    })
+
+    def render_bands():
+        mask_bands = read_rgb_bands(mask_path, band_height)
+        previous_tile_indices = None
+        for index in range(band_count):
+            row_start = index * band_height
+            row_end = min(canvas_height, row_start + band_height)
+
+            # Pixels beyond the edges of the mask are left white.
+            sea_mask = zeros((row_end - row_start, canvas_width), dtype=bool)
+            mask_band = next(mask_bands, None)
+            if mask_band is not None:
+                mask_band = mask_band[:, :canvas_width]
+                sea_mask[:mask_band.shape[0], :mask_band.shape[1]] = \
+                    (mask_band == 0).all(axis=2)
+
+            checkpoint = checkpoints.get(index)
+            if checkpoint is not None:
+                print('Using the checkpoint of band %d of %d' % (
+                    index + 1,
+                    band_count
+                ))
+                band, previous_tile_indices = checkpoint
+                yield band
+                continue
+
+            band = full(sea_mask.shape, 255, dtype=dtype('uint8'))
+            output_y, output_x = nonzero(sea_mask)
+            values, previous_tile_indices = sample_pixel_band(
+                project,
+                sea_mask,
+                row_start,
+                sampling,
+                statistic,
+                workers,
+                previous_tile_indices
+            )
+            band[output_y, output_x] = get_sea_brightness(values, max_depth)
+            checkpoints.put(index, band, previous_tile_indices)
+            print('Sampled band %d of %d' % (index + 1, band_count))
+            yield band
+
+    write_grayscale_bands(
+        output_path,
+        canvas_width,
+        canvas_height,
+        render_bands()
+    )
+    checkpoints.clear()
+
 
 @click.command()
 @click.argument(
@@ -131,6 +274,41 @@ def lookup_coord_in_geotiffs(coord: Coord, geotiffs: List[GeoTiff]) -> GeoTiff:
     default="10511",
     help='The maximum depth to calculate sea depth from.'
 )
+@click.option(
+    "--sampling",
+    default='nearest',
+    type=click.Choice(['nearest', 'area'], case_sensitive=False),
+    help='Whether to read the depth nearest to the center of each pixel, or '
+         'a statistic of the depths across each pixel. The latter requires '
+         'the bathymetry pyramid to be built.'
+)
+@click.option(
+    "--statistic",
+    default='mean',
+    type=click.Choice(STATISTICS, case_sensitive=False),
+    help='The statistic to use when sampling by area.'
+)
+@click.option(
+    "--workers",
+    default=1,
+    type=click.IntRange(min=1),
+    help='The number of processes to sample the depths with.'
+)
+@click.option(
+    "--band-height",
+    default=None,
+    type=click.IntRange(min=1),
+    help='Renders the map this many rows at a time, holding only those rows '
+         'in memory and checkpointing each band so that an interrupted '
+         'render can be resumed. Saves a TIFF if DST ends in .tif.'
+)
+@click.option(
+    "--checkpoint-dir",
+    default=None,
+    type=click.Path(file_okay=False),
+    help='Where to checkpoint the bands. Defaults to DST with .bands '
+         'appended.'
+)
 def render(
         mask: str,
         dst: str,
@@ -138,69 +316,50 @@ def render(
         center: str,
         scale: str,
         rotation: str,
-        max_depth: str
+        max_depth: str,
+        sampling: str,
+        statistic: str,
+        workers: int,
+        band_height: Optional[int],
+        checkpoint_dir: Optional[str]
 ):
+    output_filepath = Path(dst)
+    if band_height is not None:
+        if checkpoint_dir is None:
+            checkpoint_dir = output_filepath.as_posix() + '.bands'
+        stream_sea_depth(
+            Path(mask),
+            output_filepath,
+            parse_size(size),
+            parse_center(center),
+            float(scale),
+            float(rotation),
+            int(max_depth),
+            sampling,
+            statistic,
+            workers,
+            band_height,
+            Path(checkpoint_dir)
+        )
+        return
+
     # Load the land + shadow mask map, to skip cells we know we don't need to
     # render over.
-    mask = Image.open(Path(mask).as_posix()).convert('RGB')
-
-    # Load the world bathymetric map data
-    geotiffs = retrieve_geotiffs()
+    mask = asarray(Image.open(Path(mask).as_posix()).convert('RGB'))
 
-    canvas_size_in_pixels = parse_size(size)
-    center_coordinate = parse_center(center)
-    max_depth = int(max_depth)
-
-    canvas_width = CanvasUnit.from_px(canvas_size_in_pixels[0])
-    canvas_height = CanvasUnit.from_px(canvas_size_in_pixels[1])
-    canvas_shape = (int(canvas_height.px), int(canvas_width.px))
-    # For each position on the map, lookup the bathymetric value at that exact
-    # position and store in the array.
-    utm_projection_transformer_builder = UtmProjectionTransformerBuilder(
-        canvas_width,
-        canvas_height,
-        center_coordinate[0],
-        center_coordinate[1],
+    output_arr = sample_sea_depth(
+        (mask == 0).all(axis=2),
+        parse_size(size),
+        parse_center(center),
         float(scale),
-        float(rotation)
+        float(rotation),
+        int(max_depth),
+        sampling,
+        statistic,
+        workers
     )
 
-    utm_on_canvas_to_wgs84_transformer = utm_projection_transformer_builder. \
-        build_utm_on_canvas_to_wgs84()
-    output_arr = zeros(shape=canvas_shape, dtype=dtype('uint8'))
-    current_geotiff = None
-    for output_y in range(output_arr.shape[0]):
-        print(output_y)
-        for output_x in range(output_arr.shape[1]):
-            # Skip pixels that will already be covered by the land + shadow map
-            if mask.getpixel((output_x, output_y)) != (0, 0, 0):
-                output_arr[output_y][output_x] = 255
-                continue
-
-            # We want the center of the WGS84 bbox, so add 0.5 to the x and y
-            coord = utm_on_canvas_to_wgs84_transformer(
-                output_x + 0.5,
-                output_y + 0.5
-            )
-
-            # Lookup the correct geotiff to read
-            if (
-                    current_geotiff is None or
-                    not is_coord_in_geotiff(coord, current_geotiff)
-            ):
-                current_geotiff = lookup_coord_in_geotiffs(coord, geotiffs)
-
-            # Read from the geotiff and store in the output array
-            value = (current_geotiff.read_box(
-                (coord, coord), outer_points=1
-            )[0][0])
-            value = int(max(
-                0, 255 - math.floor((min(0, value) / -max_depth) * 255)
-            ))
-            output_arr[output_y][output_x] = value
-
     # Convert the array to be a grayscale bitmap.
-    output_filepath = Path(dst)
     Image \
         .fromarray(output_arr, mode='L') \
         .save(output_filepath.as_posix())
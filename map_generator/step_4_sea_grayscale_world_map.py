@@ -1,61 +1,84 @@
-import math
-
-from geotiff.geotiff import BoundaryNotInTifError
-from typing import List, Tuple
+from functools import partial
+from typing import Tuple
 
 from PIL import Image
 from map_engraver.canvas.canvas_unit import CanvasUnit
-from numpy import zeros, dtype
+from numpy import ndarray, asarray, full, nonzero, arange, minimum, maximum, \
+    ceil, dtype
 from pathlib import Path
 
 import click
-from geotiff import GeoTiff
 
+from bathymetry_pyramid import STATISTICS
 from lego_projection_transformer_builder import \
     LegoProjectionTransformerBuilder
+from parallel_sampling import sample_pixels
+
+
+def project_pixels(
+        pixel_scale_factor: int,
+        output_x: ndarray,
+        output_y: ndarray
+) -> Tuple[ndarray, ndarray, ndarray]:
+    """
+    Returns the WGS84 longitude, latitude and resolution of the center of
+    each pixel.
+    """
+    lego_projection_transformer_builder = LegoProjectionTransformerBuilder(
+        CanvasUnit.from_px(128 * pixel_scale_factor),
+        CanvasUnit.from_px(80 * pixel_scale_factor)
+    )
 
+    lego_to_wgs84_transformer = lego_projection_transformer_builder. \
+        build_lego_to_wgs84_vectorized()
 
-Coord = Tuple[float, float]
-
-
-def retrieve_geotiff_paths() -> List[Path]:
-    data_dir = Path('data/gebco_2021_sub_ice_topo_geotiff/')
-    geotiffs = [
-        'gebco_2021_sub_ice_topo_n0.0_s-90.0_w0.0_e90.0.tif',
-        'gebco_2021_sub_ice_topo_n0.0_s-90.0_w90.0_e180.0.tif',
-        'gebco_2021_sub_ice_topo_n0.0_s-90.0_w-90.0_e0.0.tif',
-        'gebco_2021_sub_ice_topo_n0.0_s-90.0_w-180.0_e-90.0.tif',
-        'gebco_2021_sub_ice_topo_n90.0_s0.0_w0.0_e90.0.tif',
-        'gebco_2021_sub_ice_topo_n90.0_s0.0_w90.0_e180.0.tif',
-        'gebco_2021_sub_ice_topo_n90.0_s0.0_w-90.0_e0.0.tif',
-        'gebco_2021_sub_ice_topo_n90.0_s0.0_w-180.0_e-90.0.tif'
+    # We want the center of the WGS84 bbox, so add 0.5 to the x and y
+    longitudes, latitudes = lego_to_wgs84_transformer(
+        output_x + 0.5,
+        output_y + 0.5
+    )
+    resolutions = lego_projection_transformer_builder.get_wgs84_resolutions(
+        output_y + 0.5
+    )
+    return longitudes, latitudes, resolutions
+
+
+def sample_sea_depth(
+        sea_mask: ndarray,
+        pixel_scale_factor: int = 1,
+        sampling: str = 'nearest',
+        statistic: str = 'mean',
+        workers: int = 1
+) -> ndarray:
+    """
+    Returns the grayscale sea depth of every pixel on the canvas that is true
+    in the sea mask, which is scaled up by the pixel scale factor. Every
+    other pixel is left white. The canvas is split into bands of rows
+    between the workers.
+    """
+    canvas_shape = (80 * pixel_scale_factor, 128 * pixel_scale_factor)
+
+    # Skip pixels that will already be covered by the land + shadow map
+    output_arr = full(canvas_shape, 255, dtype=dtype('uint8'))
+    mask = sea_mask[
+        arange(canvas_shape[0])[:, None] // pixel_scale_factor,
+        arange(canvas_shape[1])[None, :] // pixel_scale_factor
     ]
-    return list(map(lambda geotiff: data_dir.joinpath(geotiff), geotiffs))
-
-
-def retrieve_geotiffs() -> List[GeoTiff]:
-    return list(map(
-        lambda geotiff_path: GeoTiff(geotiff_path.as_posix()),
-        retrieve_geotiff_paths()
-    ))
-
+    output_y, output_x = nonzero(mask)
 
-def is_coord_in_geotiff(coord: Coord, geotiff: GeoTiff) -> bool:
-    try:
-        return len(geotiff.get_int_box(
-            (coord, coord), outer_points=1
-        )) == 2
-    except BoundaryNotInTifError:
-        return False
-
-
-def lookup_coord_in_geotiffs(coord: Coord, geotiffs: List[GeoTiff]) -> GeoTiff:
-    for geotiff in geotiffs:
-        if is_coord_in_geotiff(coord, geotiff):
-            return geotiff
-    raise Exception(
-        'Failed to lookup geotiff for (%f, %f)' % (coord[0], coord[1])
+    # For each position on the map, lookup the bathymetric value at that exact
+    # position and store in the output array.
+    values = sample_pixels(
+        partial(project_pixels, pixel_scale_factor),
+        mask,
+        sampling,
+        statistic,
+        workers
     )
+    values = 255 - ceil((minimum(0, values) / -10511.0) * 255)
+    output_arr[output_y, output_x] = maximum(0, values)
+
+    return output_arr
 
 
 @click.command()
@@ -74,59 +97,46 @@ def lookup_coord_in_geotiffs(coord: Coord, geotiffs: List[GeoTiff]) -> GeoTiff:
     default=1,
     help='Controls the size of the image'
 )
-def render(mask: str, dst: str, pixel_scale_factor: int):
+@click.option(
+    "--sampling",
+    default='nearest',
+    type=click.Choice(['nearest', 'area'], case_sensitive=False),
+    help='Whether to read the depth nearest to the center of each pixel, or '
+         'a statistic of the depths across each pixel. The latter requires '
+         'the bathymetry pyramid to be built.'
+)
+@click.option(
+    "--statistic",
+    default='mean',
+    type=click.Choice(STATISTICS, case_sensitive=False),
+    help='The statistic to use when sampling by area.'
+)
+@click.option(
+    "--workers",
+    default=1,
+    type=click.IntRange(min=1),
+    help='The number of processes to sample the depths with.'
+)
+def render(
+        mask: str,
+        dst: str,
+        pixel_scale_factor: int,
+        sampling: str,
+        statistic: str,
+        workers: int
+):
     # Load the land + shadow mask map, to skip cells we know we don't need to
     # render over.
-    mask = Image.open(Path(mask).as_posix()).convert('RGB')
-
-    # Load the world bathymetric map data
-    geotiffs = retrieve_geotiffs()
-
-    canvas_width = CanvasUnit.from_px(128 * pixel_scale_factor)
-    canvas_height = CanvasUnit.from_px(80 * pixel_scale_factor)
-    canvas_shape = (int(canvas_height.px), int(canvas_width.px))
-    # For each position on the map, lookup the bathymetric value at that exact
-    # position and store in the array.
-    lego_projection_transformer_builder = LegoProjectionTransformerBuilder(
-        canvas_width,
-        canvas_height
+    mask = asarray(Image.open(Path(mask).as_posix()).convert('RGB'))
+
+    output_arr = sample_sea_depth(
+        (mask == 0).all(axis=2),
+        pixel_scale_factor,
+        sampling,
+        statistic,
+        workers
     )
 
-    lego_to_wgs84_transformer = lego_projection_transformer_builder. \
-        build_lego_to_wgs84()
-    output_arr = zeros(shape=canvas_shape, dtype=dtype('uint8'))
-    current_geotiff = None
-    for output_y in range(output_arr.shape[0]):
-        print(output_y)
-        for output_x in range(output_arr.shape[1]):
-            # Skip pixels that will already be covered by the land + shadow map
-            if mask.getpixel((
-                    int(output_x/pixel_scale_factor),
-                    int(output_y/pixel_scale_factor)
-            )) != (0, 0, 0):
-                output_arr[output_y][output_x] = 255
-                continue
-
-            # We want the center of the WGS84 bbox, so add 0.5 to the x and y
-            coord = lego_to_wgs84_transformer(
-                output_x + 0.5,
-                output_y + 0.5
-            )
-
-            # Lookup the correct geotiff to read
-            if (
-                    current_geotiff is None or
-                    not is_coord_in_geotiff(coord, current_geotiff)
-            ):
-                current_geotiff = lookup_coord_in_geotiffs(coord, geotiffs)
-
-            # Read from the geotiff and store in the output array
-            value = (current_geotiff.read_box(
-                (coord, coord), outer_points=1
-            )[0][0])
-            value = int(255 - math.ceil((min(0, value) / -10511.0) * 255))
-            output_arr[output_y][output_x] = value
-
     # Convert the array to be a grayscale bitmap.
     output_filepath = Path(dst)
     Image \
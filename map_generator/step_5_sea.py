@@ -1,73 +1,85 @@
 import csv
-import random
+from itertools import combinations
 
 import click
 from pathlib import Path
 
-from typing import Dict, Tuple, Iterator, List
+from typing import Dict, Tuple, List, Union, Optional, TypedDict
 
 from PIL import Image
+from numpy import ndarray, asarray, array, zeros, bincount, flatnonzero, \
+    repeat, argsort, where, unique, arange, searchsorted, concatenate, add, \
+    floor, indices, nonzero, minimum, full, int64, float64
+from numpy.random import Generator, default_rng
 
 from brightness_tile_proportions import BrightnessTileProportions
+from palette import EMPTY, PALETTE, parse_tile, read_palette_image, \
+    save_palette_image
+
+
+class DistributionDeviation(TypedDict):
+    moved_tiles: int
+    total_tiles: int
+    largest_proportion_difference: float
+
+
+def read_brightness_image(image: Union[Path, ndarray]) -> ndarray:
+    """
+    Returns the brightness values of a grayscale image, reading it from disk
+    unless it has already been loaded into an array.
+    """
+    if isinstance(image, ndarray):
+        return image
+    return asarray(Image.open(image.as_posix()).convert('L'))
 
 
 def read_brightness_histogram_from_image(
-        brightness_image_path: Path,
-        mask_image_path: Path
-) -> Dict[int, int]:
+        brightness_image: Union[Path, ndarray],
+        mask_image: Union[Path, ndarray]
+) -> ndarray:
     """
     Get histogram of brightness values from sea depth image. In other words,
     count how many pixels the brightness_image has for every brightness level.
+    Returns an array with the count for each of the 256 brightness levels.
     """
-    brightness_image = Image.open(
-        brightness_image_path.as_posix()
-    ).convert('RGB')
-    mask_image = Image.open(
-        mask_image_path.as_posix()
-    ).convert('RGB')
-
-    brightness_histogram = {}
-    for y in range(brightness_image.height):
-        for x in range(brightness_image.width):
-            # Skip pixels where the mask image has non-zero content.
-            if mask_image.getpixel((x, y)) != (0, 0, 0):
-                continue
+    brightness = read_brightness_image(brightness_image)
+    mask = read_palette_image(mask_image)
 
-            # Increase the count for the measured brightness value.
-            val = int(brightness_image.getpixel((x, y))[0])
-            if val not in brightness_histogram:
-                brightness_histogram[val] = 0
-            brightness_histogram[val] += 1
-    return brightness_histogram
+    # Skip pixels where the mask image already has a tile.
+    height, width = brightness.shape
+    sea = mask[:height, :width] == EMPTY
+    return bincount(brightness[sea], minlength=256)
 
 
 def calculate_distribution_given_histogram(
-        brightness_histogram: Dict[int, int],
-        brightness_tile_proportions: Dict[int, Dict[str, float]]
-) -> Dict[int, Dict[str, int]]:
+        brightness_histogram: ndarray,
+        brightness_tile_proportions: ndarray,
+        rng: Optional[Generator] = None
+) -> ndarray:
     """
     Calculate expected number of tiles for each colors for each brightness
-    value proportional to the distribution chart.
-    """
-    distribution = {}
-    for brightness, count in brightness_histogram.items():
-        if brightness not in distribution:
-            distribution[brightness] = {}
-        tile_proportions = brightness_tile_proportions[brightness]
-
-        # Multiply the percentage by a thousand so we can get a representative
-        # sample of tiles.
-        tile_counts = [int(x * 1000000) for x in tile_proportions.values()]
-
-        for tile in random.sample(
-                list(tile_proportions.keys()),
-                counts=tile_counts,
-                k=count
-        ):
-            if tile not in distribution[brightness]:
-                distribution[brightness][tile] = 0
-            distribution[brightness][tile] += 1
+    value proportional to the distribution chart, by drawing every
+    brightness value's tiles at once from a multinomial distribution.
+    Returns a (brightness x tile) matrix of tile counts.
+    """
+    if rng is None:
+        rng = default_rng()
+
+    brightnesses = flatnonzero(brightness_histogram)
+    proportions = brightness_tile_proportions[brightnesses]
+    proportion_sums = proportions.sum(axis=1)
+    missing = flatnonzero(proportion_sums == 0)
+    if missing.size > 0:
+        raise Exception(
+            'Failed to find tile proportions for brightness %d' %
+            brightnesses[missing[0]]
+        )
 
+    distribution = zeros(brightness_tile_proportions.shape, dtype=int64)
+    distribution[brightnesses] = rng.multinomial(
+        brightness_histogram[brightnesses],
+        proportions / proportion_sums[:, None]
+    )
     return distribution
 
 
@@ -93,10 +105,56 @@ def read_max_tile_counts_from_csv(
     return max_tile_counts
 
 
+def get_group_ranks(groups: ndarray) -> ndarray:
+    """
+    Returns how many of the elements before each element are in the same
+    group.
+    """
+    order = argsort(groups, kind='stable')
+    ranks = zeros(groups.shape, dtype=int64)
+    ranks[order] = arange(groups.size) - searchsorted(
+        groups[order],
+        groups[order]
+    )
+    return ranks
+
+
+def draw_tile_sequence(
+        est_tile_counts: ndarray,
+        max_tile_counts: ndarray,
+        count: int,
+        rng: Generator
+) -> ndarray:
+    """
+    Draws tiles one at a time, where each tile is picked proportionally to
+    the percentage of it left over multiplied by its estimated count, and
+    returns the index of every tile in the order they were drawn.
+
+    This is the same as drawing without replacement from a bag holding every
+    tile, where each tile is weighted by its estimated count divided by its
+    max count. Giving every tile in the bag an exponentially distributed
+    arrival time, at the rate of its weight, and picking tiles in order of
+    arrival has the same distribution, so the whole sequence is drawn at once.
+    """
+    available = (est_tile_counts > 0) & (max_tile_counts > 0)
+    weights = zeros(est_tile_counts.shape)
+    weights[available] = \
+        est_tile_counts[available] / max_tile_counts[available]
+    bag = repeat(flatnonzero(available), max_tile_counts[available])
+    if bag.size < count:
+        raise Exception(
+            'Expected at least %d tiles to distribute, found %d' %
+            (count, bag.size)
+        )
+    arrivals = rng.exponential(size=bag.size) / weights[bag]
+    return bag[argsort(arrivals, kind='stable')[:count]]
+
+
 def calculate_distribution_given_max_counts(
-        brightness_tile_distribution: Dict[int, Dict[str, int]],
-        max_tile_counts: Dict[str, int]
-) -> Dict[int, Dict[str, int]]:
+        brightness_tile_distribution: ndarray,
+        max_tile_counts: Dict[str, int],
+        rng: Optional[Generator] = None
+) -> ndarray:
     """
     Distribute max color values proportionally to each brightness value, each
     different color at a time.
@@ -109,168 +167,536 @@ def calculate_distribution_given_max_counts(
     At the end we should have an array, indexed by brightness level, then
     indexed by color, with each value being the number of tiles
     """
-    output = {}
-    brightnesses = brightness_tile_distribution.keys()
-    tiles = max_tile_counts.keys()
-
-    for brightness in brightnesses:
-        output[brightness] = {}
-
-    used_brightnesses_count = {}
-    for brightness in brightnesses:
-        used_brightnesses_count[brightness] = 0
-
-    used_tiles_count = {}
-    for tile in tiles:
-        used_tiles_count[tile] = 0
-
-    total_tiles_to_use = 0
-    # Transpose the distribution dict for easy calculations later on. And also
-    # count how many tiles we need to distribute.
-    tile_brightness_distribution = {}
-    for brightness, tile_distributions in brightness_tile_distribution.items():
-        for tile, distribution in tile_distributions.items():
-            if tile not in tile_brightness_distribution:
-                tile_brightness_distribution[tile] = {}
-            if brightness not in tile_brightness_distribution[tile]:
-                tile_brightness_distribution[tile][brightness] = distribution
-            total_tiles_to_use += distribution
-
-    tiles = max_tile_counts.keys()
-    used_tiles_total = 0
-    while used_tiles_total < total_tiles_to_use:
-        # Select a tile based on the initial expected distribution
-        tile_weights = {}
-        for tile in tiles:
-            # The estimated tile count
-            est_tile_count = sum(tile_brightness_distribution[tile].values())
-            used_tile_count = used_tiles_count[tile]
-            max_tile_count = max_tile_counts[tile]
-            percent_left_over = 1 - used_tile_count / max_tile_count
-            # The math here is a bit dubious... The probability of selecting
-            # the same tile will decrease as the percent of each tile being
-            # used increases, but not at a rate similar to randomly choosing
-            # from a place without replacement.
-            tile_weights[tile] = percent_left_over * est_tile_count
-
-        selected_tile = random.choices(
-            list(tile_weights.keys()), weights=list(tile_weights.values())
-        )[0]
-
-        # Now select a brightness "bucket" that is not filled, and also has
-
-        brightness_weights = {}
-        for brightness, tile_distributions in \
-                brightness_tile_distribution.items():
-            est_count = 0.0001
-            if selected_tile in brightness_tile_distribution[brightness]:
-                est_count = \
-                    brightness_tile_distribution[brightness][selected_tile]
-            max_count = sum(brightness_tile_distribution[brightness].values())
-            used_count = used_brightnesses_count[brightness]
-            percent_left_over = 1 - used_count / max_count
-            brightness_weights[brightness] = percent_left_over * est_count
-
-        selected_brightness = random.choices(
-            list(brightness_weights.keys()),
-            weights=list(brightness_weights.values())
-        )[0]
-
-        used_tiles_count[selected_tile] += 1
-        used_brightnesses_count[selected_brightness] += 1
-        used_tiles_total += 1
-
-        if selected_tile not in output[selected_brightness]:
-            output[selected_brightness][selected_tile] = 0
-        output[selected_brightness][selected_tile] += 1
-
-    return output
-
-
-def raster_odd_iterator(
+    if rng is None:
+        rng = default_rng()
+
+    brightnesses = flatnonzero(
+        brightness_tile_distribution.sum(axis=1)
+    ).tolist()
+    tiles = list(max_tile_counts.keys())
+
+    # The expected distribution, and the number of tiles each brightness
+    # bucket holds.
+    expected = brightness_tile_distribution[brightnesses].astype(float64)
+    bucket_sizes = brightness_tile_distribution[brightnesses].sum(axis=1)
+
+    # The colors are picked independently of the brightness buckets, so the
+    # order they are placed in can be drawn up front.
+    tile_sequence = draw_tile_sequence(
+        expected.sum(axis=0),
+        array([max_tile_counts[tile] for tile in tiles]),
+        int(bucket_sizes.sum()),
+        rng
+    )
+
+    # Buckets are weighted by how much of them is left over multiplied by
+    # how many of the tile they are expected to have.
+    est_counts = where(expected > 0, expected, 0.0001)
+    remaining = bucket_sizes.copy()
+    counts = zeros(expected.shape, dtype=int64)
+    pending = tile_sequence
+    while pending.size > 0:
+        # Place tiles in batches that are small compared to what is left,
+        # so the weights barely change within a batch.
+        batch_size = max(1, pending.size // 64)
+        batch = pending[:batch_size]
+        pending = pending[batch_size:]
+
+        percent_left_over = remaining / bucket_sizes
+        selected = zeros(batch.shape, dtype=int64)
+        for tile in unique(batch):
+            in_batch = batch == tile
+            weights = percent_left_over * est_counts[:, tile]
+            selected[in_batch] = rng.choice(
+                len(brightnesses),
+                size=int(in_batch.sum()),
+                p=weights / weights.sum()
+            )
+
+        # Only keep as many tiles as there is room for in each bucket, in
+        # the order they were drawn. The rest are drawn again, now that the
+        # bucket is full.
+        fits = get_group_ranks(selected) < remaining[selected]
+        add.at(counts, (selected[fits], batch[fits]), 1)
+        remaining -= bincount(selected[fits], minlength=len(brightnesses))
+        pending = concatenate([batch[~fits], pending])
+
+    distribution = zeros(brightness_tile_distribution.shape, dtype=int64)
+    distribution[brightnesses] = counts
+    return distribution
+
+
+def round_largest_remainders(values: ndarray, total: int) -> ndarray:
+    """
+    Rounds the values, which sum to the total, to integers that still sum to
+    the total, rounding up the values with the largest fractional parts.
+    """
+    rounded = floor(values).astype(int64)
+    remainders = values - rounded
+    shortfall = total - int(rounded.sum())
+    rounded[argsort(-remainders, kind='stable')[:shortfall]] += 1
+    return rounded
+
+
+def fit_tile_totals(
+        est_tile_counts: ndarray,
+        max_tile_counts: ndarray,
+        total: int
+) -> ndarray:
+    """
+    Returns how many of each tile to use, so that there are as many tiles as
+    the total. Tiles are used proportionally to their estimated counts, and
+    whatever cannot be covered by a tile's max count is shared out between
+    the tiles that have some left over.
+    """
+    if max_tile_counts.sum() < total:
+        raise Exception(
+            'Expected at least %d tiles to distribute, found %d' %
+            (total, max_tile_counts.sum())
+        )
+    totals = zeros(est_tile_counts.shape)
+    capped = zeros(est_tile_counts.shape, dtype=bool)
+    while True:
+        weights = where(capped, 0, est_tile_counts)
+        if weights.sum() == 0:
+            weights = where(capped, 0, max_tile_counts - totals)
+        totals = where(
+            capped,
+            totals,
+            weights * (total - totals[capped].sum()) / weights.sum()
+        )
+        over = ~capped & (totals > max_tile_counts)
+        if not over.any():
+            break
+        totals[over] = max_tile_counts[over]
+        capped |= over
+    return round_largest_remainders(totals, total)
+
+
+def divide_or_zero(numerators: ndarray, denominators: ndarray) -> ndarray:
+    quotients = zeros(numerators.shape)
+    nonzero = denominators != 0
+    quotients[nonzero] = numerators[nonzero] / denominators[nonzero]
+    return quotients
+
+
+def fit_matrix(
+        matrix: ndarray,
+        row_totals: ndarray,
+        col_totals: ndarray,
+        max_iterations: int = 1000,
+        tolerance: float = 1e-9
+) -> ndarray:
+    """
+    Scales the rows and columns of a positive matrix in turn until its rows
+    and columns sum to the given totals, also known as iterative
+    proportional fitting.
+    """
+    fitted = matrix.copy()
+    fitted[row_totals == 0, :] = 0
+    fitted[:, col_totals == 0] = 0
+    for _ in range(max_iterations):
+        row_sums = fitted.sum(axis=1)
+        fitted *= divide_or_zero(row_totals, row_sums)[:, None]
+        col_sums = fitted.sum(axis=0)
+        fitted *= divide_or_zero(col_totals, col_sums)[None, :]
+        if abs(col_sums - col_totals).max() <= tolerance * col_totals.max():
+            break
+    return fitted
+
+
+def round_matrix(
+        matrix: ndarray,
+        row_totals: ndarray,
+        col_totals: ndarray
+) -> ndarray:
+    """
+    Rounds a matrix, whose rows and columns sum to the given integer totals,
+    to integers whose rows and columns still sum to the totals. Each value is
+    rounded either up or down.
+
+    The largest fractional parts are rounded up first. Any rows and columns
+    that are still short are then matched up along augmenting paths, which
+    can swap which values of a row or column were rounded up.
+    """
+    rounded = floor(matrix).astype(int64)
+    fractional = matrix - rounded > 1e-9
+    rounded_up = zeros(matrix.shape, dtype=bool)
+    row_shortfalls = row_totals - rounded.sum(axis=1)
+    col_shortfalls = col_totals - rounded.sum(axis=0)
+
+    for i in argsort(-(matrix - rounded), axis=None, kind='stable'):
+        row, col = divmod(int(i), matrix.shape[1])
+        if not fractional[row, col]:
+            break
+        if row_shortfalls[row] > 0 and col_shortfalls[col] > 0:
+            rounded_up[row, col] = True
+            row_shortfalls[row] -= 1
+            col_shortfalls[col] -= 1
+
+    while row_shortfalls.sum() > 0:
+        # Search from the rows that are short, alternating between values
+        # that can still be rounded up and values that were rounded up.
+        previous_rows = {}
+        previous_cols = {}
+        rows = flatnonzero(row_shortfalls > 0).tolist()
+        for row in rows:
+            previous_rows[row] = None
+        end_col = None
+        while len(rows) > 0 and end_col is None:
+            next_rows = []
+            for row in rows:
+                for col in flatnonzero(
+                        fractional[row] & ~rounded_up[row]
+                ).tolist():
+                    if col in previous_cols:
+                        continue
+                    previous_cols[col] = row
+                    if col_shortfalls[col] > 0:
+                        end_col = col
+                        break
+                    for next_row in flatnonzero(rounded_up[:, col]).tolist():
+                        if next_row not in previous_rows:
+                            previous_rows[next_row] = col
+                            next_rows.append(next_row)
+                if end_col is not None:
+                    break
+            rows = next_rows
+        if end_col is None:
+            raise Exception('Failed to round the tile distribution')
+
+        col = end_col
+        col_shortfalls[col] -= 1
+        while col is not None:
+            row = previous_cols[col]
+            rounded_up[row, col] = True
+            col = previous_rows[row]
+            if col is not None:
+                rounded_up[row, col] = False
+            else:
+                row_shortfalls[row] -= 1
+
+    return rounded + rounded_up
+
+
+def calculate_distribution_by_fitting(
+        brightness_histogram: ndarray,
+        brightness_tile_proportions: ndarray,
+        max_tile_counts: Dict[str, int]
+) -> Tuple[ndarray, DistributionDeviation]:
+    """
+    Deterministically calculates the number of tiles of each color for each
+    brightness value. Every brightness bucket is filled exactly, no more than
+    the max count of any color is used, and the counts are otherwise as
+    proportional to the distribution chart as the max counts allow. Also
+    returns how far the counts are from the distribution chart.
+    """
+    brightnesses = flatnonzero(brightness_histogram).tolist()
+    tiles = list(max_tile_counts.keys())
+    bucket_sizes = brightness_histogram[brightnesses]
+
+    proportions = brightness_tile_proportions[brightnesses]
+    expected = proportions / proportions.sum(axis=1)[:, None] * \
+        bucket_sizes[:, None]
+    tile_totals = fit_tile_totals(
+        expected.sum(axis=0),
+        array([max_tile_counts[tile] for tile in tiles]),
+        int(bucket_sizes.sum())
+    )
+
+    # Give colors a small weight in buckets they are not expected in, like
+    # `calculate_distribution_given_max_counts()` does, so that the fitting
+    # can always succeed.
+    fitted = fit_matrix(
+        where(expected > 0, expected, 0.0001),
+        bucket_sizes,
+        tile_totals
+    )
+    counts = round_matrix(fitted, bucket_sizes, tile_totals)
+
+    distribution = zeros(
+        (brightness_histogram.size, len(tiles)),
+        dtype=int64
+    )
+    distribution[brightnesses] = counts
+    return distribution, get_distribution_deviation(expected, counts)
+
+
+def get_distribution_deviation(
+        expected: ndarray,
+        actual: ndarray
+) -> DistributionDeviation:
+    """
+    Returns how far the tile counts are from the counts expected by the
+    distribution chart.
+    """
+    return {
+        'moved_tiles': round(abs(actual - expected).sum() / 2),
+        'total_tiles': int(actual.sum()),
+        'largest_proportion_difference': float(abs(
+            actual / actual.sum(axis=1)[:, None] -
+            expected / expected.sum(axis=1)[:, None]
+        ).max())
+    }
+
+
+def print_distribution_deviation(deviation: DistributionDeviation):
+    moved = deviation['moved_tiles']
+    total = deviation['total_tiles']
+    print(
+        'Tiles that differ from the distribution chart: %d of %d (%.1f%%)' %
+        (moved, total, moved / total * 100)
+    )
+    print(
+        'Largest difference in the proportion of a color at a brightness '
+        'level: %.1f%%' % (deviation['largest_proportion_difference'] * 100)
+    )
+
+
+def get_checkerboard_passes(
         width: int,
         height: int
-) -> Iterator[Tuple[int, int]]:
-    for i_h in range(height):
-        for i_w in range(int(width / 2)):
-            x = (i_w * 2 + i_h % 2)
-            y = i_h
-            if x < width:
-                yield x, y
-    for i_h in range(height):
-        for i_w in range(int(width / 2)):
-            x = (i_w * 2 + (i_h + 1) % 2)
-            y = i_h
-            if x < width:
-                yield x, y
-
-
-def get_neighboring_colors(
-        image: Image,
-        x: int,
-        y: int
-) -> List[Tuple[int, int, int]]:
-    colors = []
-    neighbor_positions = []
-    if x + 1 < image.width:
-        neighbor_positions.append(((x + 1) % image.width, y))
-    if x - 1 >= 0:
-        neighbor_positions.append(((x - 1) % image.width, y))
-    if y + 1 < image.height:
-        neighbor_positions.append((x, (y + 1) % image.width))
-    if y - 1 >= 0:
-        neighbor_positions.append((x, (y - 1) % image.width))
-    for pos in neighbor_positions:
-        try:
-            colors.append(image.getpixel((pos[0], pos[1])))
-        except ValueError:
-            continue
-    return colors
-
-
-def render_image(
-        brightness_image_path: Path,
-        overlay_image_path: Path,
-        brightness_tile_distribution: Dict[int, Dict[str, int]],
-        output_image_path: Path
-):
-    brightness_image = Image.open(
-        brightness_image_path.as_posix()
-    ).convert('RGB')
-    output_image = Image.open(
-        overlay_image_path.as_posix()
-    ).convert('RGB')
-
-    for x, y in raster_odd_iterator(output_image.width, output_image.height):
-        # Skip pixels where the image already has content.
-        if output_image.getpixel((x, y)) != (0, 0, 0):
-            continue
-        brightness = brightness_image.getpixel((x, y))[0]
-        tiles = list(brightness_tile_distribution[brightness].keys())
-        tile_weights = list(
-            brightness_tile_distribution[brightness].values()
+) -> List[Tuple[ndarray, ndarray]]:
+    """
+    Returns the (y, x) positions of the black squares of a checkerboard and
+    then the white squares, each in raster order. No two positions in the
+    same pass are neighbors.
+    """
+    ys, xs = indices((height, width))
+    black_squares = (xs + ys) % 2 == 0
+    return [nonzero(black_squares), nonzero(~black_squares)]
+
+
+def get_neighbor_colors(
+        values: ndarray,
+        ys: ndarray,
+        xs: ndarray
+) -> ndarray:
+    """
+    Returns the value the 4 neighbors of each position have in the array, as
+    a (4 x position) array. Neighbors outside the image are marked with -1.
+    """
+    height, width = values.shape
+    neighbor_colors = full((4, ys.size), -1, dtype=int64)
+    for i, (offset_y, offset_x) in enumerate(
+            ((0, 1), (0, -1), (1, 0), (-1, 0))
+    ):
+        neighbor_ys = ys + offset_y
+        neighbor_xs = xs + offset_x
+        inside = (
+            (neighbor_ys >= 0) &
+            (neighbor_ys < height) &
+            (neighbor_xs >= 0) &
+            (neighbor_xs < width)
         )
+        neighbor_colors[i, inside] = values[
+            neighbor_ys[inside],
+            neighbor_xs[inside]
+        ]
+    return neighbor_colors
 
-        tile = random.choices(tiles, weights=tile_weights, k=1)[0]
-        color = tuple([int(x) for x in tile.split(',')])
 
-        neighbor_colors = get_neighboring_colors(output_image, x, y)
-        # Re-roll selection if more than two neighboring tiles are the same
-        # color.
-        if len(list(filter(lambda c: c == color, neighbor_colors))) > 1:
-            tile = random.choices(tiles, weights=tile_weights, k=1)[0]
-            color = tuple([int(x) for x in tile.split(',')])
-            neighbor_colors = get_neighboring_colors(output_image, x, y)
+def get_reroll_masks(neighbor_colors: ndarray, tile_count: int) -> ndarray:
+    """
+    Returns a bitmask for each position of the tiles that more than one of
+    its neighbors have the color of.
+    """
+    masks = zeros(neighbor_colors.shape[1], dtype=int64)
+    for i, j in combinations(range(neighbor_colors.shape[0]), 2):
+        repeated = (
+            (neighbor_colors[i] == neighbor_colors[j]) &
+            (neighbor_colors[i] >= 0) &
+            (neighbor_colors[i] < tile_count)
+        )
+        masks[repeated] |= 1 << neighbor_colors[i][repeated]
+    return masks
 
-        if len(list(filter(lambda c: c == color, neighbor_colors))) > 1:
-            tile = random.choices(tiles, weights=tile_weights, k=1)[0]
-            color = tuple([int(x) for x in tile.split(',')])
 
-        brightness_tile_distribution[brightness][tile] -= 1
+def draw_tiles(
+        cumulative_counts: ndarray,
+        brightnesses: ndarray,
+        u: ndarray
+) -> ndarray:
+    """
+    Picks a tile for each brightness at the uniform random numbers u in
+    [0, 1), weighting each tile by its count.
+    """
+    totals = cumulative_counts[brightnesses, -1]
+    targets = minimum(u * totals, totals - 0.5)
+    return (cumulative_counts[brightnesses] <= targets[:, None]).sum(axis=1)
+
+
+def place_tiles(
+        brightness_image: Union[Path, ndarray],
+        overlay_image: Union[Path, ndarray],
+        brightness_tile_distribution: ndarray,
+        tiles: List[str],
+        rng: Optional[Generator] = None
+) -> ndarray:
+    """
+    Places the tiles on every pixel that the overlay image has not already
+    covered, picking from the remaining tiles of the pixel's brightness, and
+    returns the palette indices of the resulting image.
+
+    Pixels are placed in two passes, like the black and then the white
+    squares of a checkerboard. A tile is re-rolled, up to two times, if more
+    than one of the pixel's neighbors already has the same color. Since no
+    two pixels in a pass are neighbors, each pass is placed in batches of
+    pixels at a time.
+    """
+    if rng is None:
+        rng = default_rng()
+
+    brightness = read_brightness_image(brightness_image)
+    height, width = brightness.shape
+    palette_indices = read_palette_image(overlay_image)[:height, :width]\
+        .copy()
+
+    # Skip pixels where the image already has content.
+    empty = palette_indices == EMPTY
+
+    # Tiles are tracked by their column in the distribution, so each pixel's
+    # palette index is looked up as a column, or -1 if it is not a tile
+    # being placed. The extra entry at the end is for neighbors outside the
+    # image, which are marked -1.
+    tile_palette_indices = array([parse_tile(tile) for tile in tiles])
+    palette_to_column = full(len(PALETTE) + 1, -1, dtype=int64)
+    palette_to_column[tile_palette_indices] = arange(len(tiles))
+
+    counts = brightness_tile_distribution.copy()
+    tile_count = len(tiles)
+
+    for ys, xs in get_checkerboard_passes(width, height):
+        pass_empty = empty[ys, xs]
+        ys = ys[pass_empty]
+        xs = xs[pass_empty]
+
+        # Neighbors are only ever in the other pass, so every re-roll of this
+        # pass can be decided up front as a bitmask of the tiles that would
+        # be the same color as more than one neighbor.
+        rerolls = get_reroll_masks(
+            palette_to_column[get_neighbor_colors(palette_indices, ys, xs)],
+            tile_count
+        )
+        brightnesses = brightness[ys, xs].astype(int64)
+
+        placed = zeros(ys.shape, dtype=int64)
+        pending = arange(ys.size)
+        while pending.size > 0:
+            # Place pixels in batches that are small compared to what is
+            # left, so the weights barely change within a batch.
+            batch_size = max(1, pending.size // 64)
+            batch = pending[:batch_size]
+            pending = pending[batch_size:]
+
+            batch_brightnesses = brightnesses[batch]
+            cumulative_counts = counts.cumsum(axis=1)
+            empty_brightnesses = \
+                cumulative_counts[batch_brightnesses, -1] == 0
+            if empty_brightnesses.any():
+                raise Exception(
+                    'Ran out of tiles for brightness %d' %
+                    batch_brightnesses[empty_brightnesses][0]
+                )
+
+            # Re-roll selection if more than one neighboring tile is the
+            # same color, up to two times.
+            u = rng.random((3, batch.size))
+            selected = draw_tiles(cumulative_counts, batch_brightnesses, u[0])
+            for reroll_u in u[1:]:
+                reroll = (rerolls[batch] >> selected & 1) == 1
+                selected[reroll] = draw_tiles(
+                    cumulative_counts,
+                    batch_brightnesses[reroll],
+                    reroll_u[reroll]
+                )
+
+            # Only keep as many tiles as are left of each tile, in the order
+            # they were drawn. The rest are drawn again.
+            fits = get_group_ranks(
+                batch_brightnesses * tile_count + selected
+            ) < counts[batch_brightnesses, selected]
+            counts -= bincount(
+                batch_brightnesses[fits] * tile_count + selected[fits],
+                minlength=counts.size
+            ).reshape(counts.shape)
+            placed[batch[fits]] = selected[fits]
+            pending = concatenate([batch[~fits], pending])
+
+        palette_indices[ys, xs] = tile_palette_indices[placed]
+
+    return palette_indices
+
+
+def distribute_sea_tiles(
+        overlay_image: Union[Path, ndarray],
+        brightness_image: Union[Path, ndarray],
+        brightness_tile_proportion_csv_path: Path,
+        max_tile_counts_csv_path: Path,
+        allocation: str = 'sample',
+        rng: Optional[Generator] = None
+) -> Tuple[ndarray, Optional[DistributionDeviation]]:
+    """
+    Fills the sea of the overlay image with tiles, according to the
+    brightness image and the two CSVs, and returns the palette indices of the
+    resulting image. With the fit allocation, this also returns how far the
+    tile counts are from the distribution chart.
+    """
+    if rng is None:
+        rng = default_rng()
 
-        output_image.putpixel((x, y), color)
+    # Decode each image once, since both are needed twice.
+    brightness_arr = read_brightness_image(brightness_image)
+    overlay_arr = read_palette_image(overlay_image)
 
-    output_image.save(output_image_path.as_posix())
+    # Iterate through the bitmap and distribute the tiles according to their
+    # brightness level, and the number of tiles left in each bucket.
+    brightness_histogram = \
+        read_brightness_histogram_from_image(
+            brightness_arr,
+            overlay_arr
+        )
+
+    max_tile_counts = read_max_tile_counts_from_csv(max_tile_counts_csv_path)
+
+    brightness_tile_proportion = BrightnessTileProportions.to_matrix(
+        BrightnessTileProportions.read_from_csv(
+            brightness_tile_proportion_csv_path
+        ),
+        list(max_tile_counts.keys())
+    )
+
+    deviation = None
+    if allocation == 'fit':
+        brightness_tile_actual_distribution, deviation = \
+            calculate_distribution_by_fitting(
+                brightness_histogram,
+                brightness_tile_proportion,
+                max_tile_counts
+            )
+    else:
+        brightness_tile_expected_distribution = \
+            calculate_distribution_given_histogram(
+                brightness_histogram,
+                brightness_tile_proportion,
+                rng
+            )
+
+        brightness_tile_actual_distribution = \
+            calculate_distribution_given_max_counts(
+                brightness_tile_expected_distribution,
+                max_tile_counts,
+                rng
+            )
+
+    palette_indices = place_tiles(
+        brightness_arr,
+        overlay_arr,
+        brightness_tile_actual_distribution,
+        list(max_tile_counts.keys()),
+        rng
+    )
+    return palette_indices, deviation
 
 
 @click.command()
@@ -299,46 +725,40 @@ def render_image(
     nargs=1,
     type=click.Path(exists=False)
 )
+@click.option(
+    "--allocation",
+    default='sample',
+    type=click.Choice(['sample', 'fit'], case_sensitive=False),
+    help='Whether to randomly sample how many tiles of each color go to each '
+         'brightness level, or to calculate it deterministically so that '
+         'it fits the distribution chart as closely as possible.'
+)
+@click.option(
+    "--seed",
+    default=None,
+    type=click.INT,
+    help='Seeds the random placement of tiles, to make it reproducible.'
+)
 def render(
         overlay_image: str,
         brightness_image: str,
         brightness_tile_proportion_csv: str,
         max_tile_counts_csv: str,
-        output_image: str
+        output_image: str,
+        allocation: str,
+        seed: Optional[int]
 ):
-    # Iterate through the bitmap and distribute the tiles according to their
-    # brightness level, and the number of tiles left in each bucket.
-    brightness_histogram = \
-        read_brightness_histogram_from_image(
-            Path(brightness_image),
-            Path(overlay_image)
-        )
-
-    brightness_tile_proportion = BrightnessTileProportions.read_from_csv(
-        Path(brightness_tile_proportion_csv)
-    )
-
-    max_tile_counts = read_max_tile_counts_from_csv(Path(max_tile_counts_csv))
-
-    brightness_tile_expected_distribution = \
-        calculate_distribution_given_histogram(
-            brightness_histogram,
-            brightness_tile_proportion
-        )
-
-    brightness_tile_actual_distribution = \
-        calculate_distribution_given_max_counts(
-            brightness_tile_expected_distribution,
-            max_tile_counts
-        )
-
-    render_image(
-        Path(brightness_image),
+    output_arr, deviation = distribute_sea_tiles(
         Path(overlay_image),
-        brightness_tile_actual_distribution,
-        Path(output_image)
+        Path(brightness_image),
+        Path(brightness_tile_proportion_csv),
+        Path(max_tile_counts_csv),
+        allocation,
+        default_rng(seed)
     )
-    pass
+    if deviation is not None:
+        print_distribution_deviation(deviation)
+    save_palette_image(output_arr, Path(output_image))
 
 
 if __name__ == '__main__':
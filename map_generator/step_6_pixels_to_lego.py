@@ -1,12 +1,81 @@
-from PIL import Image
-from map_engraver.canvas import CanvasBuilder
+from map_engraver.canvas import Canvas, CanvasBuilder
 from map_engraver.canvas.canvas_unit import CanvasUnit
 from map_engraver.drawable.layout.background import Background
-from map_engraver.drawable.geometry.polygon_drawer import PolygonDrawer
+from math import pi
 from pathlib import Path
 
 import click
-from shapely.geometry import Point
+from numpy import ndarray, nonzero, unique
+
+from palette import EMPTY, PALETTE, STUD_RADIUS, read_palette_image
+
+
+def build_lego_canvas(
+        width: int,
+        height: int,
+        output_filepath: Path
+) -> Canvas:
+    """
+    Returns a black canvas with 8x enlargement, to draw the tiles of an image
+    of the given size on.
+    """
+    canvas_builder = CanvasBuilder()
+    canvas_builder.set_pixel_scale_factor(8)
+    canvas_builder.set_size(
+        CanvasUnit.from_px(width),
+        CanvasUnit.from_px(height)
+    )
+    canvas_builder.set_path(output_filepath)
+    canvas = canvas_builder.build()
+
+    # Set the background to black.
+    background = Background()
+    background.color = (0, 0, 0, 1)
+    background.draw(canvas)
+    return canvas
+
+
+def draw_studs(canvas: Canvas, image: ndarray):
+    """
+    Draws every pixel of the palette-indexed image as a round tile. The tiles
+    of each color are added to one path of arcs, so that cairo fills each
+    color once rather than once per tile.
+    """
+    pt_per_px = CanvasUnit.from_px(1).pt
+    radius = STUD_RADIUS * pt_per_px
+    context = canvas.context
+    for index in unique(image).tolist():
+        # Empty pixels would be drawn black on the black background.
+        if index == EMPTY:
+            continue
+        color = PALETTE[index]
+        context.set_source_rgba(
+            color[0] / 255,
+            color[1] / 255,
+            color[2] / 255,
+            1
+        )
+        y, x = nonzero(image == index)
+        for x_pt, y_pt in zip(
+                ((x + 0.5) * pt_per_px).tolist(),
+                ((y + 0.5) * pt_per_px).tolist()
+        ):
+            context.new_sub_path()
+            context.arc(x_pt, y_pt, radius, 0, 2 * pi)
+        context.fill()
+
+
+def render_lego(image: ndarray, output_filepath: Path):
+    """
+    Draws every pixel of the palette-indexed image as a round tile, onto a
+    canvas with 8x enlargement.
+    """
+    height, width = image.shape
+    canvas = build_lego_canvas(width, height, output_filepath)
+    draw_studs(canvas, image)
+
+    # Save the canvas
+    canvas.close()
 
 
 @click.command()
@@ -26,51 +95,10 @@ def render(
 ):
     input_filepath = Path(src)
     output_filepath = Path(dst)
-    shadow_color = (0, 53, 91)
 
     # Read the src image.
-    image = Image.open(input_filepath.as_posix()).convert('RGB')
-
-    # Create a canvas.
-    canvas_builder = CanvasBuilder()
-    canvas_builder.set_pixel_scale_factor(8)
-    canvas_builder.set_size(
-        CanvasUnit.from_px(image.width),
-        CanvasUnit.from_px(image.height)
-    )
-    canvas_builder.set_path(output_filepath)
-    canvas = canvas_builder.build()
-
-    # Set the background to black.
-    background = Background()
-    background.color = (0, 0, 0, 1)
-    background.draw(canvas)
-
-    # For each pixel we draw the pixel as a circle onto a canvas with 8x
-    # enlargement.
-    polygon_drawer = PolygonDrawer()
-    for y in range(image.height):
-        for x in range(image.width):
-            color = image.getpixel((x, y))
-            image.putpixel((x, y), shadow_color)
-
-            x_pt = CanvasUnit.from_px(x + 0.5).pt
-            y_pt = CanvasUnit.from_px(y + 0.5).pt
-            size_pt = CanvasUnit.from_px(0.475).pt
-            polygon_drawer.geoms = [
-                Point(x_pt, y_pt).buffer(size_pt)
-            ]
-            polygon_drawer.fill_color = (
-                color[0]/255,
-                color[1]/255,
-                color[2]/255,
-                1
-            )
-            polygon_drawer.draw(canvas)
-
-    # Save the canvas
-    canvas.close()
-    pass
+    image = read_palette_image(input_filepath)
+    render_lego(image, output_filepath)
 
 
 if __name__ == '__main__':
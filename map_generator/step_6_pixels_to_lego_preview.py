@@ -0,0 +1,80 @@
+from functools import lru_cache
+from pathlib import Path
+
+import click
+from PIL import Image
+from numpy import ndarray, arange, rint, uint8
+
+from palette import PALETTE_RGB, STUD_RADIUS, read_palette_image
+
+# The number of points sampled along each side of a pixel, when measuring
+# how much of the pixel a stud covers.
+SUBSAMPLES = 16
+
+
+@lru_cache(maxsize=8)
+def get_stud_sprites(scale: int) -> ndarray:
+    """
+    Returns an image of a stud of every color in the palette, on a black
+    background, where each stud spans scale by scale pixels. The edges are
+    anti-aliased by how much of each pixel the stud covers.
+    """
+    # The position of each sample, relative to the center of the stud.
+    samples = (arange(scale * SUBSAMPLES) + 0.5) / (scale * SUBSAMPLES) - 0.5
+    inside = samples[:, None] ** 2 + samples[None, :] ** 2 <= STUD_RADIUS ** 2
+    alpha = inside \
+        .reshape(scale, SUBSAMPLES, scale, SUBSAMPLES) \
+        .mean(axis=(1, 3))
+
+    sprites = rint(PALETTE_RGB[:, None, None, :] * alpha[None, :, :, None])
+    sprites = sprites.astype(uint8)
+    sprites.flags.writeable = False
+    return sprites
+
+
+def render_lego_preview(image: ndarray, scale: int = 8) -> ndarray:
+    """
+    Returns an RGB image of every pixel of the palette-indexed image as a
+    round tile, scaled up by the given factor. This looks the same as step
+    6's image, but is composed from pre-rendered studs rather than drawn.
+    """
+    height, width = image.shape
+    studs = get_stud_sprites(scale)[image]
+    return studs \
+        .transpose(0, 2, 1, 3, 4) \
+        .reshape(height * scale, width * scale, 3)
+
+
+@click.command()
+@click.argument(
+    'src',
+    nargs=1,
+    type=click.Path(exists=True)
+)
+@click.argument(
+    'dst',
+    nargs=1,
+    type=click.Path(exists=False)
+)
+@click.option(
+    "--scale",
+    default=8,
+    type=click.IntRange(min=1),
+    help='The number of pixels that each tile spans.'
+)
+def render(
+        src: str,
+        dst: str,
+        scale: int
+):
+    """
+    Quickly renders a preview of the tiles as LEGO, without cairo.
+    """
+    image = read_palette_image(Path(src))
+    Image \
+        .fromarray(render_lego_preview(image, scale), mode='RGB') \
+        .save(Path(dst).as_posix())
+
+
+if __name__ == '__main__':
+    render()
@@ -0,0 +1,127 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+from types import ModuleType
+from typing import List, Optional, Union
+
+from numpy import ndarray, load, save
+
+
+def hash_key(*parts: Union[str, bytes]) -> str:
+    """
+    Returns the SHA-256 of the parts, each prefixed by its length so that
+    moving bytes between neighboring parts changes the hash.
+    """
+    sha = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode('utf-8')
+        sha.update(b'%d:' % len(part))
+        sha.update(part)
+    return sha.hexdigest()
+
+
+def hash_parameters(parameters: dict) -> str:
+    return hash_key(json.dumps(parameters, sort_keys=True))
+
+
+def hash_files(paths: List[Path]) -> str:
+    """
+    Returns a hash of the contents of the files.
+    """
+    sha = hashlib.sha256()
+    for path in paths:
+        with open(path.as_posix(), 'rb') as file:
+            sha.update(hash_key(file.read()).encode('utf-8'))
+    return sha.hexdigest()
+
+
+def hash_modules(modules: List[ModuleType]) -> str:
+    """
+    Returns a hash of the source code of the modules, as the version of the
+    code that a step runs.
+    """
+    return hash_files([Path(module.__file__) for module in modules])
+
+
+def hash_file_stats(paths: List[Path]) -> str:
+    """
+    Returns a hash of the name, size and modification time of every file in
+    the paths, searching directories recursively. This is for data that is
+    too large to read in full, such as the GEBCO data, and that is only ever
+    replaced rather than edited. Paths that do not exist are hashed as such.
+    """
+    stats = []
+    for path in paths:
+        files = sorted(path.rglob('*')) if path.is_dir() else [path]
+        for file in files:
+            if file.is_file():
+                stat = file.stat()
+                stats.append([file.as_posix(), stat.st_size, stat.st_mtime_ns])
+            elif not file.exists():
+                stats.append([file.as_posix(), None, None])
+    return hash_key(json.dumps(stats))
+
+
+class StepCache:
+    """
+    Stores the output arrays of the pipeline's steps on disk, under a key
+    hashed from everything the step's output depends on. Once the cache
+    holds more than its max size, the least recently used outputs are
+    removed.
+    """
+
+    def __init__(self, cache_dir: Path, max_size: int):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def get_path(self, key: str) -> Path:
+        return self.cache_dir.joinpath('%s.npy' % key)
+
+    def get(self, key: str) -> Optional[ndarray]:
+        path = self.get_path(key)
+        try:
+            array = load(path.as_posix(), allow_pickle=False)
+        except FileNotFoundError:
+            return None
+        # Mark the output as recently used.
+        try:
+            os.utime(path.as_posix())
+        except FileNotFoundError:
+            pass
+        return array
+
+    def put(self, key: str, array: ndarray):
+        # Write to a temporary file first, so that other processes sharing
+        # the cache never read a partially written output.
+        path = self.get_path(key)
+        temporary_path = self.cache_dir.joinpath(
+            '%s.%d.tmp' % (key, os.getpid())
+        )
+        with open(temporary_path.as_posix(), 'wb') as file:
+            save(file, array, allow_pickle=False)
+        os.replace(temporary_path.as_posix(), path.as_posix())
+        self.evict()
+
+    def evict(self):
+        """
+        Removes the least recently used outputs until the cache fits in its
+        max size.
+        """
+        entries = []
+        for path in self.cache_dir.glob('*.npy'):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime_ns, stat.st_size, path))
+        entries.sort()
+
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total_size <= self.max_size:
+                break
+            path.unlink(missing_ok=True)
+            total_size -= size
@@ -0,0 +1,54 @@
+from typing import List, Tuple
+
+from numpy import ndarray, full, unique, searchsorted, int64
+
+BBox = Tuple[Tuple[float, float], Tuple[float, float]]
+
+
+class TileBoundsIndex:
+    """
+    Looks up which tile contains each coordinate in an array of coordinates,
+    given the ((west, north), (east, south)) bounding box of every tile.
+
+    The edges of every tile split the world into a grid of cells, and each
+    cell records the tile that covers it. A lookup is then a binary search
+    along each axis, however the tiles are arranged.
+    """
+
+    def __init__(self, bboxes: List[BBox]):
+        self.xs = unique([bbox[i][0] for bbox in bboxes for i in (0, 1)])
+        self.ys = unique([bbox[i][1] for bbox in bboxes for i in (0, 1)])
+        self.cells = full(
+            (len(self.ys) - 1, len(self.xs) - 1),
+            -1,
+            dtype=int64
+        )
+
+        # Assign in reverse so that the first tile wins if any tiles overlap.
+        for tile_id in reversed(range(len(bboxes))):
+            (west, north), (east, south) = bboxes[tile_id]
+            self.cells[
+                searchsorted(self.ys, south):searchsorted(self.ys, north),
+                searchsorted(self.xs, west):searchsorted(self.xs, east)
+            ] = tile_id
+
+    def lookup(
+            self,
+            longitudes: ndarray,
+            latitudes: ndarray
+    ) -> ndarray:
+        """
+        Returns the index of the tile containing each coordinate, or -1 if no
+        tile contains it. Tiles include their west and north edges.
+        """
+        cols = searchsorted(self.xs, longitudes, side='right') - 1
+        rows = searchsorted(self.ys, latitudes, side='left') - 1
+        in_grid = (
+            (cols >= 0) &
+            (cols < self.cells.shape[1]) &
+            (rows >= 0) &
+            (rows < self.cells.shape[0])
+        )
+        tile_ids = full(longitudes.shape, -1, dtype=int64)
+        tile_ids[in_grid] = self.cells[rows[in_grid], cols[in_grid]]
+        return tile_ids
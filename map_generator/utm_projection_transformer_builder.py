@@ -1,11 +1,76 @@
 import math
+from functools import lru_cache
 from typing import Tuple, Callable
 
 from map_engraver.canvas.canvas_unit import CanvasUnit
+from numpy import ndarray, asarray, arange, concatenate, full, float64
+from numpy.typing import ArrayLike
 from pyproj import CRS, Transformer
 from pyproj.aoi import AreaOfInterest
 from pyproj.database import query_utm_crs_info
 
+# The approximate length of a degree of latitude.
+METERS_PER_DEGREE = 111320
+
+# The datum of the UTM zones that maps are projected with.
+UTM_DATUM_NAME = 'WGS 84'
+
+
+@lru_cache(maxsize=64)
+def get_utm_crs(
+        center_longitude: float,
+        center_latitude: float,
+        datum_name: str = UTM_DATUM_NAME
+) -> CRS:
+    """
+    Returns the UTM zone containing the center. Querying the PROJ database is
+    slow, so zones are cached for the lifetime of the process.
+    """
+    utm_crs_list = query_utm_crs_info(
+        datum_name=datum_name,
+        area_of_interest=AreaOfInterest(
+            west_lon_degree=center_longitude,
+            south_lat_degree=center_latitude,
+            east_lon_degree=center_longitude,
+            north_lat_degree=center_latitude,
+        ),
+    )
+    return CRS.from_epsg(utm_crs_list[0].code)
+
+
+@lru_cache(maxsize=64)
+def get_wgs84_to_utm_transformer(
+        center_longitude: float,
+        center_latitude: float,
+        datum_name: str = UTM_DATUM_NAME
+) -> Transformer:
+    return Transformer.from_proj(
+        CRS.from_epsg(4326),
+        get_utm_crs(center_longitude, center_latitude, datum_name)
+    )
+
+
+@lru_cache(maxsize=64)
+def get_utm_to_wgs84_transformer(
+        center_longitude: float,
+        center_latitude: float,
+        datum_name: str = UTM_DATUM_NAME
+) -> Transformer:
+    return Transformer.from_proj(
+        get_utm_crs(center_longitude, center_latitude, datum_name),
+        CRS.from_epsg(4326)
+    )
+
+
+def get_rotation_matrix(
+        degrees: float
+) -> Tuple[Tuple[float, float], Tuple[float, float]]:
+    rotation_rad = degrees / 180 * math.pi
+    return (
+        (math.cos(rotation_rad), -math.sin(rotation_rad)),
+        (math.sin(rotation_rad), math.cos(rotation_rad))
+    )
+
 
 class UtmProjectionTransformerBuilder:
 
@@ -26,70 +91,127 @@ class UtmProjectionTransformerBuilder:
         self.rotation = rotation
 
     def get_utm_proj(self) -> CRS:
-        utm_crs_list = query_utm_crs_info(
-            datum_name="WGS 84",
-            area_of_interest=AreaOfInterest(
-                west_lon_degree=self.center_longitude,
-                south_lat_degree=self.center_latitude,
-                east_lon_degree=self.center_longitude,
-                north_lat_degree=self.center_latitude,
-            ),
+        return get_utm_crs(self.center_longitude, self.center_latitude)
+
+    def get_wgs84_to_utm_transformer(self) -> Transformer:
+        return get_wgs84_to_utm_transformer(
+            self.center_longitude,
+            self.center_latitude
         )
-        return CRS.from_epsg(utm_crs_list[0].code)
+
+    def get_utm_to_wgs84_transformer(self) -> Transformer:
+        return get_utm_to_wgs84_transformer(
+            self.center_longitude,
+            self.center_latitude
+        )
+
+    def get_wgs84_resolution(self) -> float:
+        """
+        Returns the approximate height of a pixel in degrees of latitude,
+        which is never more than its width in degrees of longitude.
+        """
+        return self.scale / METERS_PER_DEGREE
 
     def get_wgs84_bbox(self) -> Tuple[float, float, float, float]:
-        transformer = self.build_utm_on_canvas_to_wgs84()
+        transformer = self.build_utm_on_canvas_to_wgs84_vectorized()
 
-        min_lon = float('inf')
-        max_lon = float('-inf')
-        min_lat = float('inf')
-        max_lat = float('-inf')
+        # The bbox is found from the pixels surrounding the canvas. Within a
+        # UTM zone, the latitude and longitude are at their extremes on the
+        # edge of the canvas, unless the canvas contains a pole, which is
+        # checked for below. The canvas is assumed not to cross the
+        # antimeridian.
+        xs = arange(-1, int(self.canvas_width.px + 1))
+        ys = arange(-1, int(self.canvas_height.px + 1))
+        perimeter_x = concatenate([
+            xs,
+            xs,
+            full(ys.shape, xs[0]),
+            full(ys.shape, xs[-1])
+        ])
+        perimeter_y = concatenate([
+            full(xs.shape, ys[0]),
+            full(xs.shape, ys[-1]),
+            ys,
+            ys
+        ])
+        longitudes, latitudes = transformer(perimeter_x, perimeter_y)
+        west = float(longitudes.min())
+        south = float(latitudes.min())
+        east = float(longitudes.max())
+        north = float(latitudes.max())
 
-        for y in range(-1, int(self.canvas_height.px + 1), 1):
-            for x in range(-1, int(self.canvas_width.px + 1), 1):
-                pos = transformer(x, y)
-                min_lon = min(min_lon, pos[0])
-                max_lon = max(max_lon, pos[0])
-                min_lat = min(min_lat, pos[1])
-                max_lat = max(max_lat, pos[1])
+        # A pole within the canvas is further north or south than any pixel
+        # surrounding it, and every longitude meets at the pole.
+        wgs84_to_canvas = self.build_wgs84_to_utm_on_canvas_vectorized()
+        px_to_pt = CanvasUnit.from_px(1).pt
+        for pole_latitude in (-90, 90):
+            pole_x, pole_y = wgs84_to_canvas(0, pole_latitude)
+            if xs[0] <= pole_x / px_to_pt <= xs[-1] and \
+                    ys[0] <= pole_y / px_to_pt <= ys[-1]:
+                west = -180
+                east = 180
+                south = min(south, pole_latitude)
+                north = max(north, pole_latitude)
 
-        return min_lon, min_lat, max_lon, max_lat
+        return west, south, east, north
 
     def build_wgs84_to_utm_on_canvas(
             self
     ) -> Callable[[float, float], Tuple[float, float]]:
-        pyproj_transformer = Transformer.from_proj(
-            CRS.from_epsg(4326),
-            self.get_utm_proj()
-        )
+        vectorized_transformer = \
+            self.build_wgs84_to_utm_on_canvas_vectorized()
+
+        def transformer(
+                longitude: float,
+                latitude: float
+        ) -> Tuple[float, float]:
+            x, y = vectorized_transformer(longitude, latitude)
+            return float(x), float(y)
+
+        return transformer
+
+    def build_wgs84_to_utm_on_canvas_vectorized(
+            self
+    ) -> Callable[[ArrayLike, ArrayLike], Tuple[ndarray, ndarray]]:
+        """
+        Builds a transformer that projects arrays of WGS84 coordinates onto
+        the canvas, in points, with a single call to pyproj. Since it also
+        accepts sequences, it can be passed straight to `shapely.ops.transform`
+        to project every coordinate of a geometry at once.
+        """
+        pyproj_transformer = self.get_wgs84_to_utm_transformer()
         center_x, center_y = pyproj_transformer.transform(
             self.center_latitude,
             self.center_longitude
         )
-        rotation_rad = self.rotation / 180 * math.pi
+        rotation_matrix = get_rotation_matrix(self.rotation)
+        px_to_pt = CanvasUnit.from_px(1).pt
 
         def transformer(
-                longitude: float,
-                latitude: float
-        ) -> Tuple[float, float]:
-            x, y = pyproj_transformer.transform(latitude, longitude)
+                longitudes: ArrayLike,
+                latitudes: ArrayLike
+        ) -> Tuple[ndarray, ndarray]:
+            x, y = pyproj_transformer.transform(
+                asarray(latitudes, dtype=float64),
+                asarray(longitudes, dtype=float64)
+            )
 
             # Origin
-            x -= center_x
-            y -= center_y
+            x = x - center_x
+            y = y - center_y
 
             # Scale
-            x /= self.scale
-            y /= -self.scale
+            x = x / self.scale
+            y = y / -self.scale
 
             # Rotate
-            x_rot = x * math.cos(rotation_rad) - y * math.sin(rotation_rad)
-            y_rot = x * math.sin(rotation_rad) + y * math.cos(rotation_rad)
+            x_rot = rotation_matrix[0][0] * x + rotation_matrix[0][1] * y
+            y_rot = rotation_matrix[1][0] * x + rotation_matrix[1][1] * y
 
             # Translate
             return (
-                    CanvasUnit.from_px(x_rot).pt + self.canvas_width.pt / 2,
-                    CanvasUnit.from_px(y_rot).pt + self.canvas_height.pt / 2
+                x_rot * px_to_pt + self.canvas_width.pt / 2,
+                y_rot * px_to_pt + self.canvas_height.pt / 2
             )
 
         return transformer
@@ -97,41 +219,56 @@ class UtmProjectionTransformerBuilder:
     def build_utm_on_canvas_to_wgs84(
             self
     ) -> Callable[[float, float], Tuple[float, float]]:
-        pyproj_transformer_inv = Transformer.from_proj(
-            self.get_utm_proj(),
-            CRS.from_epsg(4326)
-        )
-        pyproj_transformer = Transformer.from_proj(
-            CRS.from_epsg(4326),
-            self.get_utm_proj()
-        )
-        center_x, center_y = pyproj_transformer.transform(
-            self.center_latitude,
-            self.center_longitude
-        )
-        rotation_rad = self.rotation / 180 * math.pi
+        vectorized_transformer = \
+            self.build_utm_on_canvas_to_wgs84_vectorized()
 
         def transformer(
                 x_canvas_px: float,
                 y_canvas_px: float
         ) -> Tuple[float, float]:
+            longitude, latitude = vectorized_transformer(
+                x_canvas_px,
+                y_canvas_px
+            )
+            return float(longitude), float(latitude)
+
+        return transformer
+
+    def build_utm_on_canvas_to_wgs84_vectorized(
+            self
+    ) -> Callable[[ArrayLike, ArrayLike], Tuple[ndarray, ndarray]]:
+        """
+        Builds a transformer that converts arrays of canvas positions, in
+        pixels, to WGS84 coordinates with a single call to pyproj.
+        """
+        pyproj_transformer_inv = self.get_utm_to_wgs84_transformer()
+        center_x, center_y = self.get_wgs84_to_utm_transformer().transform(
+            self.center_latitude,
+            self.center_longitude
+        )
+        rotation_matrix = get_rotation_matrix(-self.rotation)
+
+        def transformer(
+                x_canvas_px: ArrayLike,
+                y_canvas_px: ArrayLike
+        ) -> Tuple[ndarray, ndarray]:
             # Undo translation
-            x_rot = x_canvas_px - self.canvas_width.px / 2
-            y_rot = y_canvas_px - self.canvas_height.px / 2
+            x_rot = asarray(x_canvas_px, dtype=float64) - \
+                self.canvas_width.px / 2
+            y_rot = asarray(y_canvas_px, dtype=float64) - \
+                self.canvas_height.px / 2
             # Undo rotation
-            x = x_rot * math.cos(-rotation_rad) - y_rot * math.sin(
-                -rotation_rad)
-            y = x_rot * math.sin(-rotation_rad) + y_rot * math.cos(
-                -rotation_rad)
+            x = rotation_matrix[0][0] * x_rot + rotation_matrix[0][1] * y_rot
+            y = rotation_matrix[1][0] * x_rot + rotation_matrix[1][1] * y_rot
             # Undo scale
-            x *= self.scale
-            y *= -self.scale
+            x = x * self.scale
+            y = y * -self.scale
             # Undo origin
-            x += center_x
-            y += center_y
+            x = x + center_x
+            y = y + center_y
 
-            latitude, longitude = pyproj_transformer_inv.transform(x, y)
+            latitudes, longitudes = pyproj_transformer_inv.transform(x, y)
 
-            return longitude, latitude
+            return longitudes, latitudes
 
         return transformer
@@ -0,0 +1,32 @@
+import subprocess
+import sys
+from pathlib import Path
+from typing import List
+
+import pytest
+
+ROOT_PATH = Path(__file__).parent.parent
+
+
+@pytest.mark.parametrize('arguments', [
+    [
+        'map_analysis/count_tiles_from_image.py',
+        'readme_files/land_threshold.png'
+    ],
+    [
+        'map_analysis/count_tiles_from_ascii.py',
+        'data/lego_world_map_ascii/column-0.asc'
+    ],
+    ['map_analysis/compare_tiles_to_sea_depth.py', '--help'],
+    ['map_analysis/visualize_brightness_tile_proportions.py', '--help']
+])
+def test_script_runs(arguments: List[str]):
+    # The scripts are run the way the README runs them, so that they import
+    # the map generator's modules the same way too.
+    result = subprocess.run(
+        [sys.executable] + arguments,
+        cwd=ROOT_PATH.as_posix(),
+        capture_output=True,
+        text=True
+    )
+    assert result.returncode == 0, result.stderr
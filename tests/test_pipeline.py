@@ -0,0 +1,47 @@
+from pathlib import Path
+
+import pytest
+from click.testing import CliRunner
+from numpy import asarray
+from numpy.testing import assert_array_equal
+from PIL import Image
+
+import step_3_land_shadow
+from palette import read_palette_image
+from pipeline import add_shadow_to_land, convert_land_to_1bit
+from step_2_grayscale_to_1bit import FILTERS, convert_grayscale_to_1bit
+
+LAND_GRAYSCALE_PATH = Path(__file__).parent.parent\
+    .joinpath('readme_files/land_grayscale.png')
+
+
+@pytest.mark.parametrize('mode', list(FILTERS.keys()))
+def test_steps_2_and_3_match_scripts(mode: str, tmp_path: Path):
+    step_2_path = tmp_path.joinpath('step_2.png')
+    step_3_path = tmp_path.joinpath('step_3.png')
+    runner = CliRunner()
+    result = runner.invoke(convert_grayscale_to_1bit, [
+        LAND_GRAYSCALE_PATH.as_posix(),
+        step_2_path.as_posix(),
+        '--mode=%s' % mode
+    ])
+    assert result.exit_code == 0, result.output
+    result = runner.invoke(step_3_land_shadow.render, [
+        step_2_path.as_posix(),
+        step_3_path.as_posix(),
+        '--direction=east',
+        '--direction=south',
+        '--width=2'
+    ])
+    assert result.exit_code == 0, result.output
+
+    land = asarray(Image.open(LAND_GRAYSCALE_PATH.as_posix()))[:, :, 0]
+    land_1bit = convert_land_to_1bit(land, mode)
+    assert_array_equal(
+        land_1bit,
+        asarray(Image.open(step_2_path.as_posix()).convert('L'))
+    )
+    assert_array_equal(
+        add_shadow_to_land(land_1bit, ['east', 'south'], 2),
+        read_palette_image(step_3_path)
+    )
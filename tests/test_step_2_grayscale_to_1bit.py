@@ -0,0 +1,87 @@
+from typing import List, Tuple
+
+import pytest
+from numpy import ndarray, array, full, zeros, linspace, tile, int64, uint8
+from numpy.random import default_rng
+from numpy.testing import assert_array_equal
+
+from step_2_grayscale_to_1bit import ATKINSON_KERNEL, FLOYD_STEINBERG_KERNEL, \
+    atkinson_filter, bayer_filter, floyd_steinberg_filter, get_bayer_matrix
+
+BAYER_MATRIX = array([
+    [0, 32, 8, 40, 2, 34, 10, 42],
+    [48, 16, 56, 24, 50, 18, 58, 26],
+    [12, 44, 4, 36, 14, 46, 6, 38],
+    [60, 28, 52, 20, 62, 30, 54, 22],
+    [3, 35, 11, 43, 1, 33, 9, 41],
+    [51, 19, 59, 27, 49, 17, 57, 25],
+    [15, 47, 7, 39, 13, 45, 5, 37],
+    [63, 31, 55, 23, 61, 29, 53, 21]
+])
+
+
+def diffuse_errors_in_raster_order(
+        source: ndarray,
+        kernel: Tuple[int, List[Tuple[int, int, int]]]
+) -> ndarray:
+    # The plain error diffusion loop, visiting one pixel at a time.
+    divisor, weights = kernel
+    height, width = source.shape
+    work = source.astype(int64)
+    output = zeros(source.shape, dtype=uint8)
+    for y in range(height):
+        for x in range(width):
+            value = work[y, x]
+            quantized = 255 if value >= 128 else 0
+            output[y, x] = quantized
+            error = value - quantized
+            for offset_y, offset_x, weight in weights:
+                target_y = y + offset_y
+                target_x = x + offset_x
+                if target_y < height and 0 <= target_x < width:
+                    work[target_y, target_x] += error * weight // divisor
+    return output
+
+
+def get_test_images() -> List[ndarray]:
+    rng = default_rng(0)
+    gradient = linspace(0, 255, 40).astype(uint8)
+    return [
+        rng.integers(0, 256, (23, 31), dtype=uint8),
+        rng.integers(0, 256, (1, 17), dtype=uint8),
+        rng.integers(0, 256, (17, 1), dtype=uint8),
+        rng.integers(0, 256, (2, 2), dtype=uint8),
+        tile(gradient, (12, 1)),
+        full((9, 13), 127, dtype=uint8)
+    ]
+
+
+@pytest.mark.parametrize('filter_function,kernel', [
+    (floyd_steinberg_filter, FLOYD_STEINBERG_KERNEL),
+    (atkinson_filter, ATKINSON_KERNEL)
+])
+def test_error_diffusion_matches_raster_order(filter_function, kernel):
+    for image in get_test_images():
+        assert_array_equal(
+            filter_function(image),
+            diffuse_errors_in_raster_order(image, kernel)
+        )
+
+
+def test_bayer_matrix():
+    assert_array_equal(get_bayer_matrix(8), BAYER_MATRIX)
+
+
+@pytest.mark.parametrize('value,threshold', [
+    (0, 0),
+    (64, 16),
+    (128, 32),
+    (192, 48),
+    (255, 64)
+])
+def test_bayer_filter_of_flat_gray(value, threshold):
+    # A flat gray turns on the pixels whose rank in the matrix is below the
+    # gray's share of 64, tiled across the image.
+    image = full((12, 20), value, dtype=uint8)
+    expected = tile(BAYER_MATRIX < threshold, (2, 3))[:12, :20] * 255
+    assert_array_equal(bayer_filter(image), expected.astype(uint8))
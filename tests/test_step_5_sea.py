@@ -0,0 +1,84 @@
+import random
+from typing import List
+
+from numpy import ndarray, array, zeros, sqrt, int64, float64
+from numpy.random import default_rng
+
+from step_5_sea import calculate_distribution_given_max_counts
+
+# The expected number of tiles of each color (columns) in each brightness
+# bucket (rows), and the max count of each color. The max counts are tight,
+# so that some colors run out and buckets fill up before the end.
+EXPECTED_DISTRIBUTION = array([
+    [120, 80, 60, 30, 10],
+    [60, 60, 40, 30, 10],
+    [20, 30, 40, 40, 20],
+    [0, 10, 20, 30, 40]
+])
+MAX_TILE_COUNTS = {'a': 180, 'b': 120, 'c': 200, 'd': 100, 'e': 160}
+RUNS = 200
+
+
+def distribute_one_tile_at_a_time(
+        expected: ndarray,
+        max_counts: List[int],
+        rng: random.Random
+) -> ndarray:
+    # How step 5 used to distribute the tiles, picking a color and then a
+    # brightness bucket for every tile, one tile at a time.
+    bucket_count, tile_count = expected.shape
+    est_tile_counts = expected.sum(axis=0).tolist()
+    bucket_sizes = expected.sum(axis=1).tolist()
+    used_tile_counts = [0] * tile_count
+    used_bucket_counts = [0] * bucket_count
+    output = zeros(expected.shape, dtype=int64)
+    for _ in range(sum(bucket_sizes)):
+        tile = rng.choices(range(tile_count), weights=[
+            (1 - used_tile_counts[t] / max_counts[t]) * est_tile_counts[t]
+            for t in range(tile_count)
+        ])[0]
+        bucket = rng.choices(range(bucket_count), weights=[
+            (1 - used_bucket_counts[b] / bucket_sizes[b]) *
+            (expected[b, tile] if expected[b, tile] > 0 else 0.0001)
+            for b in range(bucket_count)
+        ])[0]
+        used_tile_counts[tile] += 1
+        used_bucket_counts[bucket] += 1
+        output[bucket, tile] += 1
+    return output
+
+
+def test_distribution_given_max_counts():
+    max_counts = array(list(MAX_TILE_COUNTS.values()))
+    rng = default_rng(0)
+    runs = []
+    for _ in range(RUNS):
+        distribution = calculate_distribution_given_max_counts(
+            EXPECTED_DISTRIBUTION,
+            MAX_TILE_COUNTS,
+            rng
+        )
+        assert (distribution.sum(axis=1) ==
+                EXPECTED_DISTRIBUTION.sum(axis=1)).all()
+        assert (distribution.sum(axis=0) <= max_counts).all()
+        runs.append(distribution)
+
+    reference_rng = random.Random(0)
+    reference_runs = [
+        distribute_one_tile_at_a_time(
+            EXPECTED_DISTRIBUTION,
+            max_counts.tolist(),
+            reference_rng
+        )
+        for _ in range(RUNS)
+    ]
+
+    # The mean count of every color in every bucket should match the mean
+    # of the one-tile-at-a-time distribution, within a few standard errors.
+    counts = array(runs, dtype=float64)
+    reference_counts = array(reference_runs, dtype=float64)
+    standard_errors = sqrt(
+        (counts.var(axis=0) + reference_counts.var(axis=0)) / RUNS
+    )
+    differences = abs(counts.mean(axis=0) - reference_counts.mean(axis=0))
+    assert (differences <= 5 * standard_errors + 0.1).all()